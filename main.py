@@ -1,14 +1,36 @@
-from module_fence.inference import main as fence
 import argparse
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Description of your script')
     # Add any command-line arguments you need
     parser.add_argument('--module', default='fence', type=str, help='Description of argument 1')
+    parser.add_argument('--workers', default=0, type=int, help='Number of detector worker processes, 0 runs detection in-process')
+    parser.add_argument('--ingest', default='poll', type=str, choices=['poll', 'mjpeg'], help='Camera ingestion: poll lastframe per frame or keep one mjpeg stream per camera')
+    parser.add_argument('--detect-timeout', default=30.0, type=float, help='Seconds to wait for a detection before the frame counts as empty; raise it on slow CPU-only boxes')
+    parser.add_argument('--metrics', action='store_true', help='Time pipeline stages and serve them at /metrics on the socket.io port')
+    # --module bench: offline replay through LogicHandler, no cameras, backend or PLC needed
+    parser.add_argument('--source', action='append', help='Video file or image directory to replay; repeat to give cameras different sources')
+    parser.add_argument('--cameras', default=1, type=int, help='Number of simulated cameras')
+    parser.add_argument('--frames', default=300, type=int, help='Frames replayed per camera')
+    parser.add_argument('--fps', default=25, type=float, help='Replay rate per camera, 0 processes every frame as fast as possible')
+    parser.add_argument('--zone', default='camera-6', type=str, help='Camera whose fence polygon the simulated cameras use')
+    parser.add_argument('--baseline', default=None, type=str, help='Results JSON to compare against')
+    parser.add_argument('--save', default=None, type=str, help='Write the results JSON here, e.g. to use as a baseline')
     args = parser.parse_args()
     return args
 
 if __name__ == "__main__":
     args = parse_arguments()
+    # imported per module so the offline bench does not need the live server stack
     if args.module == 'fence':
-        fence()
\ No newline at end of file
+        from module_fence.inference import main as fence
+        fence(num_workers=args.workers, ingest_mode=args.ingest, enable_metrics=args.metrics,
+              detect_timeout=args.detect_timeout)
+    elif args.module == 'bench':
+        if not args.source:
+            raise SystemExit("--module bench needs at least one --source")
+        from module_fence.bench import main as bench
+        regressions = bench(args.source, num_cameras=args.cameras, num_frames=args.frames, fps=args.fps,
+                            num_workers=args.workers, zone=args.zone, baseline_path=args.baseline, save_path=args.save)
+        if regressions:
+            raise SystemExit(f"worse than baseline: {', '.join(regressions)}")
\ No newline at end of file
@@ -1,8 +1,20 @@
+from typing import Optional
 from pydantic import BaseModel
 
 from system.event_handler import EventHandlerConfig
 from system.plc_controller import PLCControllerConfig
+from system.clip_buffer import ClipBufferConfig
+from module_fence.motion import MotionConfig
+from module_fence.scheduler import SchedulerConfig
 
 class LogicConfig(BaseModel):
     event_handler_config: EventHandlerConfig = None
-    plc_controller_config: PLCControllerConfig = None
\ No newline at end of file
+    plc_controller_config: PLCControllerConfig = None
+    clip_buffer_config: ClipBufferConfig = ClipBufferConfig()
+    motion_config: MotionConfig = MotionConfig()
+    scheduler_config: SchedulerConfig = SchedulerConfig()
+    # None: a box is inside when a corner is, else when this fraction of its area is
+    zone_overlap_threshold: Optional[float] = None
+    # seconds to wait for a detection before treating the frame as empty; well above
+    # any batched CPU call, so it only trips on a stuck detector (counted in get_stats)
+    detect_timeout: float = 30.0
\ No newline at end of file
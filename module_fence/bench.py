@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import shutil
+import resource
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from module_fence.base_model import LogicConfig
+from module_fence.logic_handler import LogicHandler, FRAME_SIZE
+from module_fence.detector import BatchDetector, MODEL_PATH, model_registry
+from module_fence.detector_pool import DetectorPool
+from module_fence.pipeline import CameraPipeline
+from system.event_handler import EventHandlerConfig
+from system.frame_reader import Camera
+from system.metrics import metrics
+from system.frame_age import frame_age
+from system.utils import get_polygon_points
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_frames(source, max_frames=None):
+    """JPEG bytes of the frames of a video file or an image directory, as a camera would serve them."""
+    images = []
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            if max_frames is not None and len(images) >= max_frames:
+                break
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                image = cv2.imread(os.path.join(source, filename))
+                if image is not None:
+                    images.append(image)
+    else:
+        capture = cv2.VideoCapture(source)
+        while max_frames is None or len(images) < max_frames:
+            ret, image = capture.read()
+            if not ret:
+                break
+            images.append(image)
+        capture.release()
+    if len(images) == 0:
+        raise ValueError(f"no frames in {source}")
+    return [cv2.imencode('.jpg', image)[1].tobytes() for image in images]
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        data = self.server.next_frame(self.path.rsplit('/', 1)[-1])
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class BenchSink(ThreadingHTTPServer):
+    """
+    Local stand-in for stream-manage and the event backend: serves each
+    camera's recorded frames, in a loop, as its lastframe and accepts every
+    POST, so fetching, preview publishing and event delivery run for real.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, recorded: dict):
+        super().__init__(('127.0.0.1', 0), _SinkHandler)
+        self._recorded = recorded
+        self._served = {camera_id: 0 for camera_id in recorded}
+        self._lock = threading.Lock()
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self._t = threading.Thread(target=self.serve_forever)
+        self._t.daemon = True
+        self._t.start()
+
+    def next_frame(self, camera_id):
+        frames = self._recorded.get(camera_id)
+        if frames is None:
+            return None
+        with self._lock:
+            index = self._served[camera_id]
+            self._served[camera_id] += 1
+        return frames[index % len(frames)]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ReplayCamera(Camera):
+    """Camera polling the bench sink's lastframe until num_frames were fetched."""
+
+    def __init__(self, camera_id, num_frames, frame_url, fps=25, **kwargs):
+        super().__init__(camera_id, fps=fps, frame_url=frame_url, **kwargs)
+        self._num_frames = num_frames
+        self._served = 0
+        self.done = threading.Event()
+
+    def get_bytes_from_http_api(self):
+        if self._served >= self._num_frames:
+            self.done.set()
+            return None
+        self._served += 1
+        return super().get_bytes_from_http_api()
+
+    def update_job(self):
+        while not self.done.is_set():
+            self.poll_job(duration=1)
+
+
+def _run_unpaced(camera: ReplayCamera, pipeline: CameraPipeline):
+    # every frame is processed, as fast as the handler allows
+    while True:
+        camera.update_last_frame()
+        if camera.done.is_set():
+            break
+        pipeline.process(camera.last_entry())
+
+
+def run(sources: list, num_cameras=1, num_frames=300, fps=25, num_workers=0, zone='camera-6'):
+    """
+    Replay the sources through LogicHandler for num_cameras simulated cameras.
+    Frames are fetched from, and previews and events posted to, a local
+    BenchSink, so only the network is stubbed; the PLC is a no-op. fps paces each camera like the live
+    cameras and lets the pipelines drop frames they cannot keep up with;
+    fps 0 feeds every frame as soon as the previous one is done.
+    """
+    metrics.enable()
+    recorded = {source: load_frames(source, num_frames) for source in sources}
+    points = get_polygon_points()[zone]
+    camera_ids = [f"bench-{index}" for index in range(num_cameras)]
+    sink = BenchSink({camera_id: recorded[sources[index % len(sources)]] for index, camera_id in enumerate(camera_ids)})
+    # snapshots, clips and the outbox go to a scratch directory
+    log_root = tempfile.mkdtemp(prefix='fence-bench-')
+
+    if num_workers > 0:
+        detector = DetectorPool(num_workers=num_workers, model_path=MODEL_PATH)
+    else:
+        detector = BatchDetector(MODEL_PATH)
+
+    cameras = {}
+    pipelines = {}
+    for camera_id in camera_ids:
+        cameras[camera_id] = ReplayCamera(camera_id, num_frames, f"{sink.url}/lastframe/{camera_id}", fps=fps or 25,
+                                          size=FRAME_SIZE)
+        event_handler_config = EventHandlerConfig(
+            post_frame_url=f"{sink.url}/output/{camera_id}",
+            post_event_url=f"{sink.url}/event",
+            camera_id=camera_id,
+            module_id="bench",
+            msgType=2,
+            frame_stream_size=None,
+            frame_log_size=(1280, 720),
+            frame_org_size=(1280, 720),
+            outbox_path=os.path.join(log_root, 'event_outbox.db'),
+            log_root=log_root
+        )
+        logic_config = LogicConfig(event_handler_config=event_handler_config)
+        logic_handler = LogicHandler(config=logic_config, points=points, camera_id=camera_id, detector=detector)
+        pipelines[camera_id] = CameraPipeline(logic_handler, show_fps=False)
+
+    model_registry.report(show=True)
+    start_time = time.time()
+    if fps > 0:
+        for camera_id, camera in cameras.items():
+            camera._on_new_frame = lambda camera_id: pipelines[camera_id].submit(cameras[camera_id].last_entry())
+            pipelines[camera_id].start()
+            camera.start()
+        for camera in cameras.values():
+            camera.done.wait()
+        for pipeline in pipelines.values():
+            # let the last submitted frame finish
+            deadline = time.time() + 5
+            while time.time() < deadline:
+                stats = pipeline.stats()
+                if stats['processed'] + stats['dropped'] >= stats['submitted']:
+                    break
+                time.sleep(0.01)
+            pipeline.stop()
+    else:
+        threads = [threading.Thread(target=_run_unpaced, args=(cameras[camera_id], pipelines[camera_id]))
+                   for camera_id in cameras]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.time() - start_time
+
+    if num_workers > 0:
+        detector.close()
+    sink.close()
+    shutil.rmtree(log_root, ignore_errors=True)
+
+    camera_results = {}
+    for camera_id, pipeline in pipelines.items():
+        stats = pipeline.stats()
+        camera_results[camera_id] = {
+            'processed': stats['processed'],
+            'dropped': stats['dropped'],
+            'fps': stats['processed'] / elapsed
+        }
+    stages = {}
+    for stage, histogram in metrics.stages().items():
+        stages[stage] = {
+            'p50_ms': histogram.quantile(0.5) * 1000,
+            'p95_ms': histogram.quantile(0.95) * 1000,
+            'p99_ms': histogram.quantile(0.99) * 1000,
+            'count': histogram.count
+        }
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    total_fps = sum(result['fps'] for result in camera_results.values())
+    return {
+        'config': {
+            'sources': sources, 'cameras': num_cameras, 'frames': num_frames,
+            'fps': fps, 'workers': num_workers, 'zone': zone
+        },
+        'elapsed_s': elapsed,
+        'fps_total': total_fps,
+        'fps_per_camera': total_fps / num_cameras,
+        'cameras': camera_results,
+        'stages': stages,
+        'frame_age': frame_age.report(),
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+        'peak_rss_workers_mb': children_usage.ru_maxrss / 1024
+    }
+
+
+def compare(baseline: dict, results: dict, tolerance=0.1, min_delta_ms=0.5):
+    """
+    Lines comparing results with baseline and the names of the figures that
+    got worse by more than tolerance; stage timings must also have moved by
+    more than min_delta_ms, so sub-millisecond stages do not flag on noise.
+    """
+    figures = [('fps_per_camera', True), ('fps_total', True), ('peak_rss_mb', False)]
+    for stage in sorted(results['stages']):
+        if stage in baseline.get('stages', {}):
+            figures.append((f"{stage}.p50_ms", False))
+            figures.append((f"{stage}.p95_ms", False))
+
+    def value(data, name):
+        if '.' in name:
+            stage, key = name.split('.')
+            return data['stages'][stage][key]
+        return data.get(name)
+
+    lines = []
+    regressions = []
+    for name, higher_is_better in figures:
+        old, new = value(baseline, name), value(results, name)
+        if old is None:
+            continue
+        change = (new - old) / old if old > 0 else 0
+        worse = -change if higher_is_better else change
+        if name.endswith('_ms') and abs(new - old) <= min_delta_ms:
+            worse = 0
+        marker = " <- worse" if worse > tolerance else ""
+        if marker:
+            regressions.append(name)
+        lines.append(f"{name:40s} {old:10.2f} {new:10.2f} {change:+8.1%}{marker}")
+    return lines, regressions
+
+
+def main(sources: list, num_cameras=1, num_frames=300, fps=25, num_workers=0, zone='camera-6',
+         baseline_path=None, save_path=None, tolerance=0.1):
+    results = run(sources, num_cameras, num_frames, fps, num_workers, zone)
+
+    print(f"{num_cameras} cameras, {results['elapsed_s']:.1f} s: {results['fps_total']:.1f} fps total, "
+          f"{results['fps_per_camera']:.1f} fps per camera, peak RSS {results['peak_rss_mb']:.0f} MB "
+          f"(+{results['peak_rss_workers_mb']:.0f} MB workers)")
+    for camera_id, result in results['cameras'].items():
+        print(f"{camera_id}: {result['fps']:.1f} fps, processed {result['processed']}, dropped {result['dropped']}")
+    for stage, stats in results['stages'].items():
+        print(f"{stage:28s} p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms  "
+              f"({stats['count']})")
+
+    regressions = []
+    if baseline_path is not None:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(baseline, results, tolerance)
+        print(f"{'':40s} {'baseline':>10s} {'current':>10s} {'change':>8s}")
+        for line in lines:
+            print(line)
+    if save_path is not None:
+        with open(save_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    return regressions
@@ -0,0 +1,145 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import psutil
+from ultralytics import YOLO
+
+MODEL_PATH = "models/yolov8m.pt"
+
+
+class SharedModel:
+    """A loaded model shared by every handler; calls are serialised by a lock."""
+
+    def __init__(self, model):
+        self._model = model
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._model(*args, **kwargs)
+
+
+class ModelRegistry:
+    """Process-wide cache that loads each weights file once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._stats = {}
+
+    def get(self, model_path=MODEL_PATH, task='detect') -> SharedModel:
+        key = (os.path.abspath(model_path), task)
+        with self._lock:
+            if key not in self._models:
+                process = psutil.Process()
+                rss_before = process.memory_info().rss
+                start_time = time.time()
+                model = YOLO(model_path, task=task)
+                self._models[key] = SharedModel(model)
+                self._stats[key] = {
+                    'model_path': model_path,
+                    'task': task,
+                    'load_time': time.time() - start_time,
+                    'rss_delta_mb': (process.memory_info().rss - rss_before) / (1024 * 1024),
+                    'users': 0
+                }
+            self._stats[key]['users'] += 1
+            return self._models[key]
+
+    def report(self, show=False) -> dict:
+        with self._lock:
+            stats = {
+                'models': [dict(stat) for stat in self._stats.values()],
+                'rss_mb': psutil.Process().memory_info().rss / (1024 * 1024)
+            }
+        if show:
+            for stat in stats['models']:
+                print(f"model {stat['model_path']}: loaded in {stat['load_time']:.2f}s, "
+                      f"+{stat['rss_delta_mb']:.1f} MB, {stat['users']} users")
+            print(f"process rss: {stats['rss_mb']:.1f} MB")
+        return stats
+
+
+model_registry = ModelRegistry()
+
+
+class Detection:
+    """Detector output for a single frame."""
+
+    def __init__(self, results):
+        self._results = results
+
+    def xyxy(self):
+        return self._results.boxes.xyxy.cpu().int().numpy().astype(np.int64).reshape(-1, 4)
+
+    def plot(self):
+        return self._results.plot()
+
+
+class BatchDetector:
+    """
+    Runs one detector call over the current frame of every camera.
+
+    Frames passed to submit() from concurrent camera pipelines are gathered
+    for up to batch_window seconds and detected together in one call.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, classes=0, conf=0.4, max_batch_size=None, batch_window=0.005):
+        self._model = model_registry.get(model_path, task='detect')
+        self._classes = classes
+        self._conf = conf
+        self._max_batch_size = max_batch_size
+        self._batch_window = batch_window
+        self._requests = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def model(self):
+        return self._model
+
+    def predict(self, frames: list) -> list:
+        if len(frames) == 0:
+            return []
+        batch_size = self._max_batch_size or len(frames)
+        detections = []
+        for i in range(0, len(frames), batch_size):
+            predicts = self._model(frames[i:i + batch_size], verbose=False, classes=self._classes, conf=self._conf)
+            detections.extend(Detection(predict) for predict in predicts)
+        return detections
+
+    def submit(self, frame) -> Future:
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        future = Future()
+        self._requests.put((frame, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._requests.get()]
+        deadline = time.time() + self._batch_window
+        while self._max_batch_size is None or len(batch) < self._max_batch_size:
+            try:
+                batch.append(self._requests.get(timeout=max(0, deadline - time.time())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                detections = self.predict([frame for frame, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), detection in zip(batch, detections):
+                future.set_result(detection)
@@ -0,0 +1,236 @@
+import itertools
+import queue
+import threading
+import traceback
+import multiprocessing as mp
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from module_fence.detector import MODEL_PATH
+
+FRAME_SHAPE = (720, 1280, 3)
+
+
+class PoolDetection:
+    """Detector output received from a pool worker, plotted by the worker with the model's own plot()."""
+
+    def __init__(self, frame_plot, xyxy, conf):
+        self._frame_plot = frame_plot
+        self._xyxy = xyxy
+        self._conf = conf
+
+    def xyxy(self):
+        return self._xyxy.astype(np.int64).reshape(-1, 4)
+
+    def plot(self):
+        return self._frame_plot
+
+
+def _worker(model_path, classes, conf, slot_names, frame_shape, task_conn, result_conn):
+    from ultralytics import YOLO
+
+    model = YOLO(model_path, task='detect')
+    frame_bytes = int(np.prod(frame_shape))
+    shms = [SharedMemory(name=name) for name in slot_names]
+    frames = [np.ndarray(frame_shape, dtype=np.uint8, buffer=shm.buf) for shm in shms]
+    plots = [np.ndarray(frame_shape, dtype=np.uint8, buffer=shm.buf, offset=frame_bytes) for shm in shms]
+    try:
+        while True:
+            task = task_conn.recv()
+            if task is None:
+                break
+            task_id, slot = task
+            try:
+                predicts = model(frames[slot], verbose=False, classes=classes, conf=conf)
+                boxes = predicts[0].boxes
+                # plotted here so pool detections look exactly like in-process ones
+                np.copyto(plots[slot], predicts[0].plot())
+                result_conn.send((task_id, boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), None))
+            except Exception:
+                result_conn.send((task_id, None, None, traceback.format_exc()))
+    finally:
+        del frames, plots
+        for shm in shms:
+            shm.close()
+
+
+class _PoolWorker:
+    def __init__(self, process, task_conn, result_conn):
+        self.process = process
+        self.task_conn = task_conn
+        self.result_conn = result_conn
+        self.send_lock = threading.Lock()
+        self.in_flight = 0
+
+
+class DetectorPool:
+    """
+    Runs detection in worker processes.
+
+    Frames are copied into preallocated shared memory slots, so only the
+    slot index goes to the worker and only the boxes come back; the worker
+    plots the detections into the second half of the slot.
+
+    Each worker has its own pipes, so a worker that dies cannot leave a
+    shared queue locked for the others. The result thread also waits on
+    the workers' sentinels: when one exits, its tasks fail with
+    RuntimeError, their slots are freed and the worker is started again.
+    A submit that finds no free slot within slot_timeout seconds, e.g.
+    behind a hung worker, fails with TimeoutError instead of blocking.
+    """
+
+    def __init__(self, num_workers=2, model_path=MODEL_PATH, classes=0, conf=0.4, num_slots=None,
+                 frame_shape=FRAME_SHAPE, slot_timeout=30.0):
+        self._frame_shape = tuple(frame_shape)
+        self._slot_timeout = slot_timeout
+        num_slots = num_slots or num_workers * 2
+        self._ctx = mp.get_context('spawn')
+
+        frame_bytes = int(np.prod(self._frame_shape))
+        self._shms = [SharedMemory(create=True, size=2 * frame_bytes) for _ in range(num_slots)]
+        self._slot_frames = [np.ndarray(self._frame_shape, dtype=np.uint8, buffer=shm.buf) for shm in self._shms]
+        self._slot_plots = [np.ndarray(self._frame_shape, dtype=np.uint8, buffer=shm.buf, offset=frame_bytes)
+                            for shm in self._shms]
+        self._free_slots = queue.Queue()
+        for slot in range(num_slots):
+            self._free_slots.put(slot)
+
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._closing = False
+        self.restart_count = 0
+
+        self._worker_args = (model_path, classes, conf, [shm.name for shm in self._shms], self._frame_shape)
+        self._workers = [self._start_worker() for _ in range(num_workers)]
+
+        self._collector = threading.Thread(target=self._collect)
+        self._collector.daemon = True
+        self._collector.start()
+
+    def _start_worker(self):
+        task_reader, task_conn = self._ctx.Pipe(duplex=False)
+        result_conn, result_writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(target=_worker, args=self._worker_args + (task_reader, result_writer))
+        process.daemon = True
+        process.start()
+        # the worker holds the other ends; closing ours lets recv() see EOF when it dies
+        task_reader.close()
+        result_writer.close()
+        return _PoolWorker(process, task_conn, result_conn)
+
+    def submit(self, frame) -> Future:
+        if frame.shape != self._frame_shape:
+            raise ValueError(f"frame shape {frame.shape} does not match pool shape {self._frame_shape}")
+        future = Future()
+        # waits while every slot is in flight, which bounds the work queued on the pool
+        try:
+            slot = self._free_slots.get(timeout=self._slot_timeout)
+        except queue.Empty:
+            future.set_exception(FutureTimeoutError(f"no free detector slot within {self._slot_timeout} s"))
+            return future
+        np.copyto(self._slot_frames[slot], frame)
+        task_id = next(self._task_ids)
+        with self._pending_lock:
+            worker = min(self._workers, key=lambda worker: worker.in_flight)
+            worker.in_flight += 1
+            self._pending[task_id] = (future, slot, worker)
+        try:
+            with worker.send_lock:
+                worker.task_conn.send((task_id, slot))
+        except OSError:
+            # the worker is gone; the result thread fails the task when it restarts it
+            pass
+        return future
+
+    def _finish(self, task_id):
+        """The task's future and slot, now free; None if the task was already finished."""
+        with self._pending_lock:
+            pending = self._pending.pop(task_id, None)
+            if pending is None:
+                return None
+            future, slot, worker = pending
+            worker.in_flight -= 1
+        self._free_slots.put(slot)
+        return future
+
+    def _handle_result(self, result):
+        task_id, xyxy, conf, error = result
+        # only this thread finishes tasks, so the slot stays the task's until _finish
+        with self._pending_lock:
+            pending = self._pending.get(task_id)
+        if pending is None:
+            return
+        frame_plot = self._slot_plots[pending[1]].copy() if error is None else None
+        future = self._finish(task_id)
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(PoolDetection(frame_plot, xyxy, conf))
+
+    def _restart(self, index):
+        worker = self._workers[index]
+        process = worker.process
+        print(f"Detector worker {process.pid} exited with code {process.exitcode}, restarting")
+        # results it sent before dying still count
+        try:
+            while worker.result_conn.poll():
+                self._handle_result(worker.result_conn.recv())
+        except (EOFError, OSError):
+            pass
+        with self._pending_lock:
+            self._workers[index] = self._start_worker()
+            lost = [task_id for task_id, (_, _, owner) in self._pending.items() if owner is worker]
+        for task_id in lost:
+            future = self._finish(task_id)
+            if future is not None:
+                future.set_exception(RuntimeError(f"detector worker {process.pid} exited with code {process.exitcode}"))
+        worker.task_conn.close()
+        worker.result_conn.close()
+        self.restart_count += 1
+
+    def _collect(self):
+        while not self._closing:
+            readers = {}
+            for index, worker in enumerate(self._workers):
+                readers[worker.result_conn] = index
+                readers[worker.process.sentinel] = index
+            ready = wait(list(readers), timeout=1.0)
+            dead = set()
+            for reader in ready:
+                index = readers[reader]
+                if reader is self._workers[index].result_conn:
+                    try:
+                        self._handle_result(reader.recv())
+                    except (EOFError, OSError):
+                        dead.add(index)
+                else:
+                    dead.add(index)
+            if self._closing:
+                break
+            for index in dead:
+                self._workers[index].process.join(timeout=1)
+                self._restart(index)
+
+    def close(self):
+        self._closing = True
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.task_conn.send(None)
+            except OSError:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+        self._collector.join(timeout=5)
+        for worker in self._workers:
+            worker.task_conn.close()
+            worker.result_conn.close()
+        self._slot_frames = []
+        self._slot_plots = []
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
@@ -2,10 +2,14 @@ import traceback
 from system.utils import get_computer_name, get_ipv4_address
 import requests
 from system.event_handler import EventHandlerConfig
+from system.event_outbox import get_event_outbox
 from system.frame_reader import FrameReader
 from system.plc_controller import PLCControllerConfig
 from module_fence.base_model import LogicConfig
-from module_fence.logic_handler import LogicHandler
+from module_fence.logic_handler import LogicHandler, FRAME_SIZE
+from module_fence.detector import BatchDetector, MODEL_PATH, model_registry
+from module_fence.detector_pool import DetectorPool
+from module_fence.pipeline import CameraPipeline
 import time
 from system.utils import get_polygon_points
 import cv2
@@ -13,6 +17,8 @@ from system.socket import sokect_server
 import threading
 import eventlet
 from system.utils import SERVER_BE_IP
+from system.metrics import metrics
+from system.frame_age import frame_age
 
 def get_camera_ids():
     server_name = get_computer_name()
@@ -21,13 +27,19 @@ def get_camera_ids():
     content = res.json()
     return [camera['camera_id'] for camera in content['data']['cameras']]
 
-def main():
+def main(num_workers=0, ingest_mode='poll', enable_metrics=False, detect_timeout=30.0):
+    metrics.enable(enable_metrics)
     dict_points = get_polygon_points()
     module_id = "motion-detections"
     camera_ids = get_camera_ids()
     server_name = get_computer_name()
 
-    frame_reader = FrameReader(camera_ids)
+    # cameras decode directly at the handlers' working size so LogicHandler never resizes
+    frame_reader = FrameReader(camera_ids, {camera_id: {'mode': ingest_mode, 'size': FRAME_SIZE} for camera_id in camera_ids})
+    if num_workers > 0:
+        detector = DetectorPool(num_workers=num_workers, model_path=MODEL_PATH, slot_timeout=detect_timeout)
+    else:
+        detector = BatchDetector(MODEL_PATH)
     logic_handlers = {}
 
     for camera_id in camera_ids:
@@ -50,10 +62,15 @@ def main():
         )
         logic_config = LogicConfig(
             event_handler_config=event_handler_config,
+            detect_timeout=detect_timeout,
             # plc_controller_config=plc_controller_config
         )
-        logic_handlers[camera_id] = LogicHandler(config=logic_config, points=dict_points[camera_id], camera_id=camera_id)
+        logic_handlers[camera_id] = LogicHandler(config=logic_config, points=dict_points[camera_id], camera_id=camera_id, detector=detector)
 
+    model_registry.report(show=True)
+    # one outbox serves every camera's EventHandler
+    outbox = get_event_outbox(event_handler_config.outbox_path, event_handler_config.outbox_batch_size,
+                              event_handler_config.outbox_max_attempts)
         
     server_instance = sokect_server.SocketIOServer(logic_handlers)
 
@@ -66,28 +83,43 @@ def main():
     eventlet.sleep(1)
     
 
-    frames_dict_1 = frame_reader.get_last_frames()
-    frames_dict_2 = frame_reader.get_last_frames()
-    start_time = time.time()
-
+    # each camera runs on its own pipeline thread; detection calls made
+    # concurrently by the pipelines are batched by the shared detector
+    pipelines = {}
+    for camera_id, logic_handler in logic_handlers.items():
+        pipelines[camera_id] = CameraPipeline(logic_handler)
+        pipelines[camera_id].start()
+
+    # sequence numbers of the last frame handed out per camera, so a frame
+    # is never processed twice when the loop outruns the camera fetch
+    since = {}
+    stats_time = time.time()
     while True:
         try:
-            for frame_dict1, frame_dict2 in zip(frames_dict_1.items(), frames_dict_2.items()):
-
-                key1, value1 = frame_dict1
-                key2, value2 = frame_dict2
-
-                logic_handlers[key1].update(value1, value2)
-                logic_handlers[key1].count_frame()
-                # logic_handlers[key1].show_state_record()
-                logic_handlers[key1].fps(show=True)
-
-            frames_dict_2 = frame_reader.get_last_frames()
-            end_time = time.time()
-            n_time = 0.5
-            if end_time - start_time > n_time:
-                start_time = end_time
-                frames_dict_1 = frames_dict_2
+            for camera_id, entry in frame_reader.wait_for_frames(since, timeout=0.1).items():
+                since[camera_id] = entry.seq
+                pipelines[camera_id].submit(entry)
+
+            if time.time() - stats_time > 30:
+                stats_time = time.time()
+                for camera_id, stats in frame_reader.get_stats().items():
+                    print(f"{camera_id}: fetched {stats['fetched']}, decoded {stats['decoded']}, skipped {stats['skipped']}")
+                for camera_id, logic_handler in logic_handlers.items():
+                    print(f"{camera_id}: {logic_handler.get_stats()}")
+                print(f"event outbox: {outbox.stats()}")
+                for camera_id, stale in frame_age.stale_cameras().items():
+                    print(f"{camera_id}: frames up to {stale['worst_ms']:.0f} ms old at decision, mostly {stale['cause']}")
+                if metrics.enabled:
+                    for camera_id, stages in metrics.summary().items():
+                        print(camera_id, ", ".join(f"{stage} p50 {stats['p50_ms']:.1f} p95 {stats['p95_ms']:.1f} p99 {stats['p99_ms']:.1f} ms"
+                                                   for stage, stats in stages.items()))
+
+            # every HighGUI call stays on this thread; the pipelines only hand over frames
+            for logic_handler in logic_handlers.values():
+                debug_frames = logic_handler.debug_frames.get(timeout=0)
+                if debug_frames is not None:
+                    for window_name, image in debug_frames.items():
+                        cv2.imshow(window_name, image)
 
             key = cv2.waitKey(1) & 0xFF
             if key == ord('q'):
@@ -97,4 +129,6 @@ def main():
             traceback.print_exc()
             continue
 
+    for pipeline in pipelines.values():
+        pipeline.stop()
     cv2.destroyAllWindows()
\ No newline at end of file
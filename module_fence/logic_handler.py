@@ -1,4 +1,5 @@
 import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 from module_fence.base_model import LogicConfig
 from system.utils import *
@@ -6,28 +7,46 @@ from system.event_handler import EventHandler, EventHandlerBase
 from system.plc_controller import PLCController, PLCControllerBase
 import cv2
 from PIL import Image, ImageChops
-from ultralytics import YOLO
+from module_fence.detector import BatchDetector, MODEL_PATH
+from system.clip_buffer import ClipBuffer
+from system.mailbox import Mailbox
+from system.box_ops import merge_boxes
+from system.zone_mask import ZoneMask
+from system.zone_overlay import ZoneOverlay
+from system.metrics import metrics
+from system.frame_age import frame_age
+from module_fence.motion import MotionDetector
+from module_fence.scheduler import DetectorScheduler
+
+FRAME_SIZE = (1280, 720)
+DANGER_AREA_COLOR = (60, 76, 231)
+SAFE_AREA_COLOR = (18, 156, 243)
 
 class LogicHandler:
-    def __init__(self, config: LogicConfig, points, camera_id) -> None:
+    def __init__(self, config: LogicConfig, points, camera_id, detector=None) -> None:
         self._config = config
         if self._config.event_handler_config is not None:
             self._event_handler = EventHandler(self._config.event_handler_config)
         else:
             self._event_handler = EventHandlerBase(self._config.event_handler_config)
         if self._config.plc_controller_config is not None:
-            self._plc_controller = PLCController(self._config.plc_controller_config)
+            self._plc_controller = PLCController(self._config.plc_controller_config, camera_id)
         else:
             self._plc_controller = PLCControllerBase(self._config.plc_controller_config)
 
-        self._model = YOLO("models/yolov8m.pt", task='detect')
+        if detector is None:
+            detector = BatchDetector(MODEL_PATH)
+        self._detector = detector
         
         self._number_true_frame = 7
         self._last_event_timestamp = 0
         self._last_handle_wrong = True
-        self.frame_1 = None
-        self.frame_2 = None
         self._points = points
+        self._zone = ZoneMask(self._points['POINTS_2'], FRAME_SIZE)
+        # frame_plot is always a fresh array, so the overlay is blended into it in place
+        self._zone_overlay = ZoneOverlay(self._points['POINTS_2'], FRAME_SIZE, TRANSPARENT_SCORE, LINE_AREA_COLOR)
+        self._motion_detector = MotionDetector(self._zone, FRAME_SIZE, self._config.motion_config)
+        self._scheduler = DetectorScheduler(self._config.scheduler_config)
         self.colors = get_color_dict()
         self._camera_id = camera_id
         self._start_time = time.time()
@@ -35,17 +54,27 @@ class LogicHandler:
         self._count_frame = 0
         self._is_clicked_alarm = False
         self.is_start_record = False
-        self._video_frames = {
-            'org': [],
-            'frame_plot': []
-        }
+        self._clip_config = self._config.clip_buffer_config
+        self._clip_buffer = ClipBuffer(
+            frame_shape=(FRAME_SIZE[1], FRAME_SIZE[0], 3),
+            memory_budget_mb=self._clip_config.memory_budget_mb)
+        self._recorded_frames = 0
+        self._detect_timeout_count = 0
+        self._detect_error_count = 0
+        # latest debug windows for the main thread, {window name: image}
+        self.debug_frames = Mailbox()
+        self._is_streaming_clip = False
         self._current_fps = 0
 
     def fps(self, f=1.0, show=False):
         self._end_time = time.time()
         if self._end_time - self._start_time >= f:
             if show:
-                print(f"{self._camera_id}: {self._count_frame} fps")
+                timing = self._motion_detector.timing()
+                scheduler_stats = self._scheduler.stats()
+                print(f"{self._camera_id}: {self._count_frame} fps, motion {timing['motion_ms']:.1f} ms "
+                      f"on {timing['roi_fraction']:.0%} of the frame, "
+                      f"detector skipped {scheduler_stats['skip_ratio']:.0%}")
             self._start_time = self._end_time
             self._current_fps = self._count_frame
             self._count_frame = 0
@@ -57,50 +86,67 @@ class LogicHandler:
             
         print(f"{self._camera_id}: {self.is_start_record}")
 
-    def _process_frame(self, frame1, frame2):
-        inside_yn = False
+    def preprocess(self, frame):
+        """Resize the frame to the working size, skipping frames already at that size."""
+        if frame.shape[1::-1] != FRAME_SIZE:
+            with metrics.timer(self._camera_id, 'resize'):
+                frame = cv2.resize(frame, FRAME_SIZE)
+        return frame
 
-        frame1 = cv2.resize(frame1, (1280, 720))
-        frame2 = cv2.resize(frame2, (1280, 720))
-        frame_plot = frame2.copy()
+    def _process_frame(self, frame2):
+        inside_yn = False
 
-        # frame1 = remove_green(frame1)
         # frame2 = remove_green(frame2)
         
-        predicts = self._model(frame_plot, verbose=False, classes=0, conf=0.4)
-        
-        bboxes = predicts[0].boxes.xyxy.cpu().int().tolist()
-        bboxes = [[[box[0], box[1]], [box[2], box[3]]] for box in bboxes]
-        
-        frame_plot = predicts[0].plot()
-        # cv2.imshow("frame_plot", frame_plot)
+        # in DANGER the detector runs on every frame, so it is started before
+        # the motion stage; otherwise motion decides whether it runs at all
+        is_danger = self._number_true_frame < 7
+        submit_time = time.perf_counter()
+        detection = None
+        if is_danger:
+            self._scheduler.mark_run()
+            detection = self._detector.submit(frame2)
         
-        diff = cv2.absdiff(frame1, frame2)
+        with metrics.timer(self._camera_id, 'motion'):
+            motion_boxes = self._motion_detector.detect(frame2)
 
-        diff_gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-        blur = cv2.medianBlur(diff_gray, 21)
-        _, thresh = cv2.threshold(blur, 25, 255, cv2.THRESH_BINARY)
+        if detection is None and self._scheduler.should_detect(len(motion_boxes) > 0, is_danger):
+            submit_time = time.perf_counter()
+            detection = self._detector.submit(frame2)
 
-        dilated = cv2.dilate(thresh, None, iterations=3)
-        contours, _ = cv2.findContours(
-            dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        # the detector answers asynchronously while the motion stage runs
+        if detection is not None:
+            # a stuck or failed detector must not stall the camera; the frame counts as empty
+            try:
+                detection = detection.result(timeout=self._config.detect_timeout)
+            except FutureTimeoutError as e:
+                self._detect_timeout_count += 1
+                print(f"Camera {self._camera_id}: detector timed out ({e!r}), frame treated as no detection")
+                detection = None
+            except Exception as e:
+                self._detect_error_count += 1
+                print(f"Camera {self._camera_id}: detector failed ({e!r}), frame treated as no detection")
+                detection = None
+            # submit to result, including any batching wait
+            metrics.observe(self._camera_id, 'detect', time.perf_counter() - submit_time)
 
-        bounding_boxs = bboxes
-        for contour in contours:
-            (x, y, w, h) = cv2.boundingRect(contour)
-            if cv2.contourArea(contour) < 1200:
-                continue
-
-            bounding_boxs.append([[int(x), int(y)], [int(x + w), int(y + h)]])
+        if detection is not None:
+            bboxes = detection.xyxy()
+            frame_plot = detection.plot()
+        else:
+            bboxes = np.empty((0, 4), dtype=np.int64)
+            frame_plot = frame2.copy()
+        # cv2.imshow("frame_plot", frame_plot)
 
-        bounding_boxs = merge_bbox(bounding_boxs, merge_margin=20)
+        with metrics.timer(self._camera_id, 'merge_boxes'):
+            bounding_boxs = np.concatenate((bboxes, motion_boxes))
+            bounding_boxs = merge_boxes(bounding_boxs, merge_margin=20)
 
-        for i, box in enumerate(bounding_boxs):
-            p1, p2 = box
-            x1, y1 = p1
-            x2, y2 = p2
+        zone_start_time = time.perf_counter()
+        for i, box in enumerate(bounding_boxs.tolist()):
+            x1, y1, x2, y2 = box
 
-            if check_bbox_in_poly((x1, y1, x2, y2), self._points['POINTS_2']):
+            if self._zone.check_bbox((x1, y1, x2, y2), self._config.zone_overlap_threshold):
                 inside_yn = True
                 self.is_start_record = True
                 # plot_detection_result((x1, y1, x2, y2),
@@ -111,34 +157,35 @@ class LogicHandler:
             #     plot_detection_result((x1, y1, x2, y2),
             #         frame_plot, self.colors[str(100)],
             #         'undefined object', None)
+        metrics.observe(self._camera_id, 'zone_test', time.perf_counter() - zone_start_time)
 
         if self._camera_id == 'camera-1':
-            dilated = cv2.resize(dilated, (720, 508))
-            frame1 = cv2.resize(frame1, (720, 508))
+            dilated = cv2.resize(self._motion_detector.mask, (720, 508))
+            background = cv2.resize(self._motion_detector.background(), (720, 508))
             frame2 = cv2.resize(frame2, (720, 508))
-            cv2.imshow("dilated", dilated)
-            cv2.imshow("frame1", frame1)
-            cv2.imshow("frame2", frame2)
-
-        key = cv2.waitKey(1)
-        if key == ord('q'):
-            print()
+            # HighGUI is not thread-safe, so the main thread shows these
+            self.debug_frames.put({"dilated": dilated, "background": background, "frame2": frame2})
 
         return inside_yn, frame_plot
 
-    def update(self, frame1, frame2):
-        is_wrong, frame_plot = self._process_frame(frame1, frame2)
+    def update(self, frame2, capture_time=None):
+        """capture_time: the frame's capture stamp, carried to the PLC, event and preview sinks."""
+        capture_time = capture_time or time.time()
+        frame2 = self.preprocess(frame2)
+        is_wrong, frame_plot = self._process_frame(frame2)
+        frame_age.record(self._camera_id, 'decision', capture_time)
         
         if is_wrong:
             current_timestamp = int(time.time())
             plot_text(frame_plot, (50, 50), "DANGER: OBJECT IN FENCE", (0, 0, 255), line_width=3)
-            frame_plot = draw_area(self._points['POINTS_2'], frame_plot)
+            with metrics.timer(self._camera_id, 'overlay'):
+                frame_plot = self._zone_overlay.draw(frame_plot, DANGER_AREA_COLOR)
 
             if self._last_event_timestamp != current_timestamp and self._last_handle_wrong:
                 self._last_event_timestamp = current_timestamp
-                self._plc_controller.turn_on()
+                self._plc_controller.turn_on(capture_time)
                 
-                self._event_handler.update(frame2, frame_plot)
+                self._event_handler.update(frame2, frame_plot, capture_time)
                     
                 self._last_handle_wrong = False
 
@@ -148,38 +195,77 @@ class LogicHandler:
             self._number_true_frame += 1
             if self._number_true_frame >= 7:
                 plot_text(frame_plot, (50, 50), f"SAFE", (0, 255, 0), line_width=3)
-                frame_plot = draw_area(self._points['POINTS_2'], frame_plot, (18, 156, 243))
-                self._plc_controller.turn_off()
+                with metrics.timer(self._camera_id, 'overlay'):
+                    frame_plot = self._zone_overlay.draw(frame_plot, SAFE_AREA_COLOR)
+                self._plc_controller.turn_off(capture_time)
                 self._last_handle_wrong = True
 
             else:
                 plot_text(frame_plot, (50, 50), "DANGER: OBJECT IN FENCE", (0, 0, 255), line_width=3)
 
-                frame_plot = draw_area(self._points['POINTS_2'], frame_plot)
+                with metrics.timer(self._camera_id, 'overlay'):
+                    frame_plot = self._zone_overlay.draw(frame_plot, DANGER_AREA_COLOR)
 
          
-        videos = []
-        if self.is_start_record or self._is_clicked_alarm:
-            print(f'{self._camera_id} - frame number ', len(self._video_frames['org']))
-            self._event_handler.fps = self._current_fps
-            if len(self._video_frames['org']) <= (int(self._current_fps) * 10):
-                self._video_frames['org'].append(frame2)
-                self._video_frames['frame_plot'].append(frame_plot)
-            else:
-                videos = self._video_frames
-                self._video_frames = {
-                    'org': [],
-                    'frame_plot': []
-                }
-                self.is_start_record = False
-                 
-        if len(videos) > 0 and self._is_clicked_alarm:
+        self._record_clip(frame2, frame_plot)
+        self._event_handler.post_frame(frame_plot, capture_time)
+
+        return is_wrong, frame_plot
+
+    def _record_clip(self, frame_org, frame_plot):
+        fps = int(self._current_fps)
+        if fps <= 0:
+            return
+        pre_roll_frames = fps * self._clip_config.pre_roll_seconds
+        clip_frames = fps * self._clip_config.clip_seconds
+        self._clip_buffer.set_capacity(pre_roll_frames + clip_frames)
+
+        # the ring keeps the last pre_roll_seconds even while idle, so a clip
+        # also shows what happened before the detection or the alarm click
+        is_recording = self.is_start_record or self._is_clicked_alarm
+        if not is_recording:
+            if pre_roll_frames > 0:
+                self._clip_buffer.append(frame_org, frame_plot)
+                self._clip_buffer.trim(pre_roll_frames)
+            return
+
+        self._event_handler.fps = fps
+        if self._is_clicked_alarm and not self._is_streaming_clip:
+            # the clip is wanted: hand the ring's frames over to the encoder thread
+            # as they are, without copying or waiting for them, then stream live frames
+            self._event_handler.start_video(fps)
+            self._event_handler.write_video_frames(self._clip_buffer.take())
+            self._is_streaming_clip = True
+            # the clip runs clip_seconds past the click, however late in the detection it came
+            self._recorded_frames = 0
+
+        if self._is_streaming_clip:
+            self._event_handler.write_video_frame(frame_org, frame_plot)
+        else:
+            self._clip_buffer.append(frame_org, frame_plot)
+        self._recorded_frames += 1
+        print(f'{self._camera_id} - frame number ', self._recorded_frames)
+        if self._recorded_frames <= clip_frames:
+            return
+
+        if self._is_streaming_clip:
             print(f'{self._camera_id}: Done frame')
-            self._event_handler.update_video(videos['org'], videos['frame_plot'])
+            self._event_handler.finish_video()
+            self._is_streaming_clip = False
             self._is_clicked_alarm = False
-        self._event_handler.post_frame(frame_plot)
+        # back to idle: keep only the pre-roll in memory
+        self._clip_buffer.trim(pre_roll_frames)
+        self._clip_buffer.release()
+        self._recorded_frames = 0
+        self.is_start_record = False
 
-        return is_wrong, frame_plot
+    def get_stats(self):
+        detector_stats = self._scheduler.stats()
+        detector_stats.update({'timeouts': self._detect_timeout_count, 'errors': self._detect_error_count})
+        stats = {'detector': detector_stats, 'plc': self._plc_controller.get_stats(),
+                 'frame_age': frame_age.report(self._camera_id).get(self._camera_id, {})}
+        stats.update(self._event_handler.get_stats())
+        return stats
 
     def count_frame(self):
         self._count_frame += 1
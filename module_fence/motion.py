@@ -0,0 +1,141 @@
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+
+from system.zone_mask import ZoneMask
+
+
+class MotionConfig(BaseModel):
+    # "running_average", "mog2" or "knn"
+    background: str = "running_average"
+    # None: each model's default, 0.05 for running_average and automatic (1 / history) for mog2/knn
+    learning_rate: Optional[float] = None
+    roi_margin: int = 40
+    scale: float = 1.0
+    min_area: int = 1200
+    blur_size: int = 21
+    threshold: int = 25
+    dilate_iterations: int = 3
+
+
+class RunningAverageBackground:
+    """Exponential running average kept in place in a preallocated float buffer."""
+
+    def __init__(self, learning_rate=0.05):
+        self._learning_rate = learning_rate
+        self._background = None
+        self._background_u8 = None
+        self._diff = None
+
+    def apply(self, gray):
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            self._background_u8 = gray.copy()
+            self._diff = np.zeros_like(gray)
+            return self._diff
+        cv2.convertScaleAbs(self._background, dst=self._background_u8)
+        cv2.absdiff(gray, self._background_u8, dst=self._diff)
+        cv2.accumulateWeighted(gray, self._background, self._learning_rate)
+        return self._diff
+
+    def background(self):
+        return self._background_u8
+
+
+class SubtractorBackground:
+    """OpenCV MOG2 or KNN background subtractor; learning_rate -1 lets OpenCV pick it from the history length."""
+
+    def __init__(self, kind="mog2", learning_rate=-1):
+        if kind == "knn":
+            self._subtractor = cv2.createBackgroundSubtractorKNN(detectShadows=False)
+        else:
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+        self._learning_rate = learning_rate
+
+    def apply(self, gray):
+        return self._subtractor.apply(gray, learningRate=self._learning_rate)
+
+    def background(self):
+        return self._subtractor.getBackgroundImage()
+
+
+def create_background_model(config: MotionConfig):
+    if config.background in ("mog2", "knn"):
+        return SubtractorBackground(config.background, -1 if config.learning_rate is None else config.learning_rate)
+    if config.background == "running_average":
+        return RunningAverageBackground(0.05 if config.learning_rate is None else config.learning_rate)
+    raise ValueError(f"unknown background model {config.background}")
+
+
+class MotionDetector:
+    """
+    Motion against a per-camera background model, restricted to the zone's
+    bounding rectangle plus a margin, in grayscale and optionally at a
+    reduced scale. Boxes are returned in full-frame coordinates.
+    """
+
+    def __init__(self, zone: ZoneMask, frame_size=(1280, 720), config: MotionConfig = None):
+        self._config = config or MotionConfig()
+        width, height = frame_size
+        margin = self._config.roi_margin
+        x, y, w, h = zone.rect
+        self._roi = (max(0, x - margin), max(0, y - margin), min(width, x + w + margin), min(height, y + h + margin))
+        self._roi_fraction = (self._roi[2] - self._roi[0]) * (self._roi[3] - self._roi[1]) / (width * height)
+
+        scale = self._config.scale
+        self._blur_size = max(3, int(self._config.blur_size * scale) | 1)
+        self._dilate_iterations = max(1, round(self._config.dilate_iterations * scale))
+        self._min_area = self._config.min_area * scale * scale
+
+        self._background = create_background_model(self._config)
+        self._total_time = 0
+        self._count = 0
+        self.mask = None
+
+    @property
+    def roi(self):
+        return self._roi
+
+    def _prepare(self, frame):
+        x1, y1, x2, y2 = self._roi
+        gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        if self._config.scale != 1:
+            gray = cv2.resize(gray, None, fx=self._config.scale, fy=self._config.scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def background(self):
+        return self._background.background()
+
+    def detect(self, frame):
+        """Motion boxes of frame against the background as an (N, 4) [x1, y1, x2, y2] array; updates the background."""
+        start_time = time.perf_counter()
+        diff = self._background.apply(self._prepare(frame))
+        blur = cv2.medianBlur(diff, self._blur_size)
+        _, thresh = cv2.threshold(blur, self._config.threshold, 255, cv2.THRESH_BINARY)
+        self.mask = cv2.dilate(thresh, None, iterations=self._dilate_iterations)
+        contours, _ = cv2.findContours(self.mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes = []
+        for contour in contours:
+            if cv2.contourArea(contour) < self._min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            boxes.append([x, y, x + w, y + h])
+
+        boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4) / self._config.scale
+        boxes = boxes.round().astype(np.int64) + np.array([self._roi[0], self._roi[1], self._roi[0], self._roi[1]])
+
+        self._total_time += time.perf_counter() - start_time
+        self._count += 1
+        return boxes
+
+    def timing(self, reset=True):
+        """Average motion stage time in ms and the share of the frame it covers."""
+        average = self._total_time / self._count * 1000 if self._count > 0 else 0
+        if reset:
+            self._total_time = 0
+            self._count = 0
+        return {'motion_ms': average, 'roi_fraction': self._roi_fraction}
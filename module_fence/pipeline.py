@@ -0,0 +1,67 @@
+import threading
+import traceback
+
+from module_fence.logic_handler import LogicHandler
+from system.frame_reader import FrameEntry
+from system.mailbox import Mailbox
+from system.frame_age import frame_age
+
+
+class CameraPipeline:
+    """Runs one camera's LogicHandler on its own thread, fed through a latest-wins mailbox."""
+
+    def __init__(self, logic_handler: LogicHandler, show_fps=True):
+        self._logic_handler = logic_handler
+        self._show_fps = show_fps
+        self._mailbox = Mailbox()
+        self._last_seq = 0
+        self._running = False
+        self.processed_count = 0
+
+    def submit(self, entry: FrameEntry):
+        """Hand the newest frame entry to the pipeline; an unprocessed older entry is dropped."""
+        self._mailbox.put(entry)
+
+    def stats(self):
+        return {
+            'submitted': self._mailbox.put_count,
+            'dropped': self._mailbox.dropped_count,
+            'processed': self.processed_count,
+            'last_seq': self._last_seq,
+            'fps': self._logic_handler._current_fps
+        }
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def process(self, entry: FrameEntry):
+        """Run one entry through the handler on the calling thread; returns False if it was skipped."""
+        if entry.seq <= self._last_seq:
+            return False
+        self._last_seq = entry.seq
+        frame_age.record(self._logic_handler._camera_id, 'dequeued', entry.capture_time)
+        # decoded here, on the pipeline thread, and only for frames that get processed
+        frame = entry.frame
+        if frame is None:
+            return False
+        self._logic_handler.update(frame, capture_time=entry.capture_time)
+        self._logic_handler.count_frame()
+        self._logic_handler.fps(show=self._show_fps)
+        self.processed_count += 1
+        return True
+
+    def _run(self):
+        while self._running:
+            entry = self._mailbox.get(timeout=0.5)
+            if entry is None:
+                continue
+            try:
+                self.process(entry)
+            except:
+                traceback.print_exc()
@@ -0,0 +1,44 @@
+import time
+
+from pydantic import BaseModel
+
+
+class SchedulerConfig(BaseModel):
+    enabled: bool = True
+    heartbeat_interval: float = 1.0
+
+
+class DetectorScheduler:
+    """
+    Decides per frame whether the detector runs: always while the handler
+    is in DANGER, whenever the motion stage saw activity near the fence,
+    and otherwise once per heartbeat_interval seconds.
+    """
+
+    def __init__(self, config: SchedulerConfig = None):
+        self._config = config or SchedulerConfig()
+        self._last_run_time = 0
+        self.run_count = 0
+        self.skip_count = 0
+
+    def should_detect(self, has_motion, is_danger):
+        current_time = time.time()
+        run = (not self._config.enabled or is_danger or has_motion
+               or current_time - self._last_run_time >= self._config.heartbeat_interval)
+        if run:
+            self.mark_run(current_time)
+        else:
+            self.skip_count += 1
+        return run
+
+    def mark_run(self, current_time=None):
+        self._last_run_time = current_time or time.time()
+        self.run_count += 1
+
+    def stats(self):
+        total = self.run_count + self.skip_count
+        return {
+            'runs': self.run_count,
+            'skips': self.skip_count,
+            'skip_ratio': self.skip_count / total if total > 0 else 0
+        }
@@ -0,0 +1,173 @@
+"""
+Vectorised bounding box operations.
+
+Boxes are (N, 4) arrays of [x1, y1, x2, y2]. These are array-in, array-out
+counterparts of merge_bbox, non_max_suppression and
+merge_n_nearest_boxes_by_distance in system.utils and return the same boxes.
+"""
+import numpy as np
+
+
+def points_to_boxes(boxes):
+    """[[[x1, y1], [x2, y2]], ...] -> (N, 4) array."""
+    return np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+
+
+def boxes_to_points(boxes):
+    """(N, 4) array -> [[[x1, y1], [x2, y2]], ...]."""
+    return [[[x1, y1], [x2, y2]] for x1, y1, x2, y2 in np.asarray(boxes).tolist()]
+
+
+def overlap_matrix(boxes, margin=0):
+    """Pairwise overlap of every box grown by margin with every other box; the diagonal is False."""
+    boxes = np.asarray(boxes)
+    x1 = boxes[:, 0] - margin
+    y1 = boxes[:, 1] - margin
+    x2 = boxes[:, 2] + margin
+    y2 = boxes[:, 3] + margin
+    overlaps = (x1[:, None] < boxes[None, :, 2]) & (boxes[None, :, 0] < x2[:, None]) \
+        & (y1[:, None] < boxes[None, :, 3]) & (boxes[None, :, 1] < y2[:, None])
+    np.fill_diagonal(overlaps, False)
+    return overlaps
+
+
+def connected_components(adjacency):
+    """
+    Component label of every node, by array-wide union-find: roots are
+    hooked onto the smaller root of each crossing edge, then paths are
+    compressed by pointer jumping until every edge stays inside a component.
+    """
+    parent = np.arange(len(adjacency))
+    i, j = np.nonzero(adjacency)
+    while True:
+        root_i, root_j = parent[i], parent[j]
+        crossing = root_i != root_j
+        if not crossing.any():
+            return parent
+        high = np.maximum(root_i[crossing], root_j[crossing])
+        low = np.minimum(root_i[crossing], root_j[crossing])
+        np.minimum.at(parent, high, low)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def merge_boxes(boxes, merge_margin=5):
+    """
+    Merge boxes that overlap once grown by merge_margin into their bounding box,
+    repeated until no two boxes overlap. Same boxes as utils.merge_bbox, the
+    order may differ.
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    while len(boxes) > 1:
+        overlaps = overlap_matrix(boxes, merge_margin)
+        if not overlaps.any():
+            break
+        _, labels = np.unique(connected_components(overlaps), return_inverse=True)
+        labels = labels.reshape(-1)
+        count = labels.max() + 1
+        merged = np.empty((count, 4), dtype=boxes.dtype)
+        merged[:, :2] = np.iinfo(boxes.dtype).max if boxes.dtype.kind in 'iu' else np.inf
+        merged[:, 2:] = np.iinfo(boxes.dtype).min if boxes.dtype.kind in 'iu' else -np.inf
+        np.minimum.at(merged[:, 0], labels, boxes[:, 0])
+        np.minimum.at(merged[:, 1], labels, boxes[:, 1])
+        np.maximum.at(merged[:, 2], labels, boxes[:, 2])
+        np.maximum.at(merged[:, 3], labels, boxes[:, 3])
+        boxes = merged
+    return boxes
+
+
+def box_areas(boxes):
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def non_max_suppression(boxes, threshold):
+    """Greedy NMS, largest area first; returns the kept boxes in selection order."""
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    if len(boxes) == 0:
+        return boxes
+    areas = box_areas(boxes)
+    order = np.argsort(-areas, kind='stable')
+    selected = []
+    while len(order) > 0:
+        best = order[0]
+        selected.append(best)
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]))
+        h = np.maximum(0, np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]))
+        intersection = w * h
+        with np.errstate(divide='ignore', invalid='ignore'):
+            iou = intersection / (areas[best] + areas[rest] - intersection)
+        # NaN from an empty union drops the box, as the division error does in utils
+        order = rest[iou <= threshold]
+    return boxes[selected]
+
+
+def box_centers(boxes):
+    return np.stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2), axis=1)
+
+
+def merge_n_nearest_boxes_by_distance(boxes, n, distance_threshold):
+    """For every box, grow it by its n nearest boxes (by center) that stay within distance_threshold."""
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    if len(boxes) == 0:
+        return boxes
+    centers = box_centers(boxes)
+    distances = np.sqrt(((centers[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+    nearest = np.argsort(distances, axis=1)[:, :n]
+
+    merged = boxes.copy()
+    for k in range(nearest.shape[1]):
+        others = boxes[nearest[:, k]]
+        merged_centers = box_centers(merged)
+        other_centers = box_centers(others)
+        dist = np.sqrt(((merged_centers - other_centers) ** 2).sum(axis=1))
+        close = dist <= distance_threshold
+        merged[close, :2] = np.minimum(merged[close, :2], others[close, :2])
+        merged[close, 2:] = np.maximum(merged[close, 2:], others[close, 2:])
+    return merged
+
+
+if __name__ == "__main__":
+    import copy
+    import time
+    from system import utils
+
+    def sorted_boxes(boxes):
+        return sorted(tuple(int(v) for v in box) for box in boxes)
+
+    rng = np.random.default_rng(0)
+    for count in (20, 100, 300):
+        xy = rng.integers(0, 1200, size=(count, 2))
+        wh = rng.integers(5, 80, size=(count, 2))
+        boxes = np.concatenate((xy, xy + wh), axis=1)
+        points = boxes_to_points(boxes)
+
+        start_time = time.perf_counter()
+        expected = utils.merge_bbox(copy.deepcopy(points), merge_margin=20)
+        loop_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        result = merge_boxes(boxes, merge_margin=20)
+        array_time = time.perf_counter() - start_time
+        assert sorted_boxes(points_to_boxes(expected)) == sorted_boxes(result)
+        print(f"merge     n={count}: loops {loop_time * 1000:8.2f} ms, numpy {array_time * 1000:6.2f} ms")
+
+        start_time = time.perf_counter()
+        expected = utils.non_max_suppression(boxes.tolist(), 0.3)
+        loop_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        result = non_max_suppression(boxes, 0.3)
+        array_time = time.perf_counter() - start_time
+        assert np.array_equal(np.asarray(expected).reshape(-1, 4), result)
+        print(f"nms       n={count}: loops {loop_time * 1000:8.2f} ms, numpy {array_time * 1000:6.2f} ms")
+
+        start_time = time.perf_counter()
+        expected = utils.merge_n_nearest_boxes_by_distance(boxes.tolist(), 3, 60)
+        loop_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        result = merge_n_nearest_boxes_by_distance(boxes, 3, 60)
+        array_time = time.perf_counter() - start_time
+        assert np.array_equal(np.asarray(expected).reshape(-1, 4), result)
+        print(f"distance  n={count}: loops {loop_time * 1000:8.2f} ms, numpy {array_time * 1000:6.2f} ms")
@@ -0,0 +1,85 @@
+from collections import deque
+
+import numpy as np
+from pydantic import BaseModel
+
+
+class ClipBufferConfig(BaseModel):
+    # per-camera cap; a 1280x720 frame pair is ~5.5 MB, so 512 MB holds ~93 pairs
+    # and at lower handler fps a whole pre-roll plus clip fits
+    memory_budget_mb: int = 512
+    clip_seconds: int = 10
+    pre_roll_seconds: int = 3
+
+
+class ClipBuffer:
+    """
+    Ring of (org, plot) frame pairs, allocated lazily.
+
+    The capacity is set from fps * (pre_roll_seconds + clip_seconds) with
+    set_capacity() and capped by memory_budget_mb; once full the oldest
+    pair is overwritten, so a clip longer than the cap loses its head.
+    Pair buffers are only allocated as the ring grows; trimmed ones are
+    kept for reuse until release() hands them back, so an idle camera
+    only holds its pre-roll.
+    """
+
+    def __init__(self, frame_shape=(720, 1280, 3), memory_budget_mb=512):
+        self._frame_shape = tuple(frame_shape)
+        frame_bytes = int(np.prod(frame_shape))
+        self._max_capacity = max(1, (memory_budget_mb * 1024 * 1024) // (2 * frame_bytes))
+        self._capacity = self._max_capacity
+        self._pairs = deque()
+        self._spare = []
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def set_capacity(self, frames):
+        """Hold up to frames pairs, capped by the memory budget."""
+        self._capacity = max(1, min(int(frames), self._max_capacity))
+        self.trim(self._capacity)
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def _new_pair(self):
+        if len(self._spare) > 0:
+            return self._spare.pop()
+        return np.empty(self._frame_shape, dtype=np.uint8), np.empty(self._frame_shape, dtype=np.uint8)
+
+    def append(self, frame_org, frame_plot):
+        if len(self._pairs) >= self._capacity:
+            pair = self._pairs.popleft()
+        else:
+            pair = self._new_pair()
+        np.copyto(pair[0], frame_org)
+        np.copyto(pair[1], frame_plot)
+        self._pairs.append(pair)
+
+    def trim(self, keep):
+        """Drop all but the newest keep pairs; their buffers are kept for reuse."""
+        keep = max(0, keep)
+        while len(self._pairs) > keep:
+            self._spare.append(self._pairs.popleft())
+
+    def clear(self):
+        self.trim(0)
+
+    def release(self):
+        """Free the buffers kept for reuse."""
+        self._spare.clear()
+
+    def __iter__(self):
+        """The buffered (org, plot) pairs, oldest first, as the ring's own arrays."""
+        return iter(list(self._pairs))
+
+    def take(self):
+        """
+        Detach the buffered pairs, oldest first, without copying them. The
+        ring starts over empty and never writes into the returned arrays.
+        """
+        pairs = list(self._pairs)
+        self._pairs.clear()
+        return pairs
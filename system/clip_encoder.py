@@ -0,0 +1,97 @@
+import queue
+import threading
+import traceback
+
+import cv2
+
+from system.image_utils import image_resize
+
+
+class ClipEncoder:
+    """
+    Encodes clips incrementally on its own thread.
+
+    start() opens one cv2.VideoWriter per output, write() appends a frame to
+    every output and finish() finalises the files. Frames wait in a bounded
+    queue; a non-blocking write() drops the frame when the queue is full.
+    """
+
+    def __init__(self, queue_size=128, on_finished=None):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._on_finished = on_finished
+        self.written_count = 0
+        self.dropped_count = 0
+        self._t = threading.Thread(target=self._run)
+        self._t.daemon = True
+        self._t.start()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self, outputs: list, fps, context=None):
+        """outputs: list of (path, size); size None keeps the frame size."""
+        self._queue.put(('start', (outputs, fps, context)))
+
+    def write(self, frames: tuple, block=False):
+        """frames: one frame per output, in the order given to start()."""
+        try:
+            self._queue.put(('frame', frames), block=block)
+        except queue.Full:
+            self.dropped_count += 1
+
+    def write_many(self, frames_list: list):
+        """Queue several frames tuples as one item, so a pre-roll never waits for free slots."""
+        if len(frames_list) == 0:
+            return
+        try:
+            self._queue.put(('frames', frames_list), block=False)
+        except queue.Full:
+            self.dropped_count += len(frames_list)
+
+    def finish(self):
+        self._queue.put(('finish', None))
+
+    def _open_writers(self, outputs, fps, frames):
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writers = []
+        for (path, size), frame in zip(outputs, frames):
+            size = tuple(size) if size is not None else frame.shape[1::-1]
+            writers.append((cv2.VideoWriter(path, fourcc, fps, size), size))
+        return writers
+
+    def _release(self, writers):
+        for writer, _ in writers:
+            writer.release()
+
+    def _run(self):
+        clip = None
+        writers = None
+        while True:
+            command, payload = self._queue.get()
+            try:
+                if command == 'start':
+                    if writers is not None:
+                        self._release(writers)
+                    clip = payload
+                    writers = None
+                elif command in ('frame', 'frames'):
+                    if clip is None:
+                        continue
+                    for frames in ([payload] if command == 'frame' else payload):
+                        if writers is None:
+                            # opened on the first frame so a size of None can follow the frames
+                            writers = self._open_writers(clip[0], clip[1], frames)
+                        for (writer, size), frame in zip(writers, frames):
+                            if frame.shape[1::-1] != size:
+                                frame = image_resize(frame, size)
+                            writer.write(frame)
+                        self.written_count += 1
+                elif command == 'finish':
+                    if writers is not None:
+                        self._release(writers)
+                    finished, clip, writers = clip, None, None
+                    if finished is not None and self._on_finished is not None:
+                        self._on_finished(finished[2])
+            except Exception:
+                traceback.print_exc()
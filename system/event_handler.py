@@ -1,12 +1,15 @@
 import os.path
 import time
-import requests
-import threading
 from typing import Optional
 from system.utils import get_computer_name, get_ipv4_address
 
 from pydantic import BaseModel
-from system.image_utils import image_resize, image_to_bytes, save_image, save_video
+from system.image_utils import save_image
+from system.clip_encoder import ClipEncoder
+from system.frame_publisher import FramePublisher
+from system.event_lane import EventLane
+from system.event_outbox import get_event_outbox
+from system.frame_age import frame_age
 
 class EventHandlerConfig(BaseModel):
     post_frame_url: str
@@ -18,6 +21,20 @@ class EventHandlerConfig(BaseModel):
     frame_stream_size: Optional[tuple] = None
     frame_log_size: Optional[tuple] = None
     frame_org_size: Optional[tuple] = None
+    video_queue_size: int = 128
+    # snapshot lane: "block", "drop_oldest" or "drop_newest" when full;
+    # snapshots within one coalesce interval keep only the newest
+    snapshot_queue_size: int = 16
+    snapshot_queue_policy: str = "drop_oldest"
+    snapshot_coalesce_interval: Optional[float] = 1.0
+    clip_event_queue_size: int = 16
+    # events are kept here until the backend acknowledges them
+    outbox_path: str = "logs/event_outbox.db"
+    outbox_batch_size: int = 50
+    # failed deliveries before an event is moved to the dead_letter table
+    outbox_max_attempts: int = 10
+    # snapshots and clips are written under <log_root>/<module_id>/<camera_id>
+    log_root: str = "C:/Users/delai/source/repos/Fence/logs/videos"
 
 class EventImageInfo(BaseModel):
     image_log_filename: str
@@ -41,31 +58,50 @@ class EventHandlerBase:
     def __init__(self, config: EventHandlerConfig):
         pass
     
-    def update(self, frame_org, frame_log):
+    def update(self, frame_org, frame_log, capture_time=None):
         pass
     
     def update_video(self, frame_org: list, frame_log: list):
         pass
 
-    def post_frame(self, frame):
+    def start_video(self, fps=None):
         pass
 
+    def write_video_frame(self, frame_org, frame_log, block=False):
+        pass
+
+    def write_video_frames(self, frames: list):
+        pass
+
+    def finish_video(self):
+        pass
+
+    def post_frame(self, frame, capture_time=None):
+        pass
+
+    def get_stats(self):
+        return {}
+
 
 class EventHandler(EventHandlerBase):
     def __init__(self, config: EventHandlerConfig):
         self._config = config
-        self._queue = []
-        self._queue_video = []
         self.fps = 0
-        self._t = threading.Thread(target=self._run)
-        self._t.daemon = True
-        self._t.start()
+        self._snapshot_lane = EventLane(f"snapshots-{config.camera_id}", self._process_snapshot,
+                                        config.snapshot_queue_size, config.snapshot_queue_policy)
+        # video events are posted off the encoder thread so a slow backend never stalls encoding
+        self._clip_event_lane = EventLane(f"clip-events-{config.camera_id}", self._process_clip_event,
+                                          config.clip_event_queue_size, "block")
+        self._clip_encoder = ClipEncoder(queue_size=config.video_queue_size, on_finished=self._on_video_finished)
+        self._frame_publisher = FramePublisher(config.post_frame_url, frame_size=config.frame_stream_size,
+                                               camera_id=config.camera_id)
+        self._outbox = get_event_outbox(config.outbox_path, config.outbox_batch_size, config.outbox_max_attempts)
 
     def _get_event_image_info(self, timestamp) -> EventImageInfo:
         image_log_filename = f"{self._config.module_id}_{self._config.camera_id}_{timestamp}.jpg"
         image_log_uri = f"/public/videos/{self._config.module_id}/{self._config.camera_id}/{image_log_filename}"
 
-        image_root_path = f"C:/Users/delai/source/repos/Fence/logs/videos/{self._config.module_id}/{self._config.camera_id}"
+        image_root_path = f"{self._config.log_root}/{self._config.module_id}/{self._config.camera_id}"
         if not os.path.exists(image_root_path):
             os.makedirs(image_root_path)
 
@@ -73,7 +109,7 @@ class EventHandler(EventHandlerBase):
 
         image_org_filename = f"{self._config.module_id}_{self._config.camera_id}_{timestamp}_org.jpg"
         image_org_uri = f"/public/videos/{self._config.module_id}/{self._config.camera_id}/{image_org_filename}"
-        image_org_root_path = f"C:/Users/delai/source/repos/Fence/logs/videos/{self._config.module_id}/{self._config.camera_id}"
+        image_org_root_path = f"{self._config.log_root}/{self._config.module_id}/{self._config.camera_id}"
         if not os.path.exists(image_org_root_path):
             os.makedirs(image_org_root_path)
 
@@ -92,7 +128,7 @@ class EventHandler(EventHandlerBase):
         video_log_filename = f"{self._config.module_id}_{self._config.camera_id}_{timestamp}.mp4"
         video_log_uri = f"/public/videos/{self._config.module_id}/{self._config.camera_id}/{video_log_filename}"
 
-        video_root_path = f"C:/Users/delai/source/repos/Fence/logs/videos/{self._config.module_id}/{self._config.camera_id}"
+        video_root_path = f"{self._config.log_root}/{self._config.module_id}/{self._config.camera_id}"
         if not os.path.exists(video_root_path):
             os.makedirs(video_root_path)
 
@@ -100,7 +136,7 @@ class EventHandler(EventHandlerBase):
 
         video_org_filename = f"{self._config.module_id}_{self._config.camera_id}_{timestamp}_org.mp4"
         video_org_uri = f"/public/videos/{self._config.module_id}/{self._config.camera_id}/{video_org_filename}"
-        video_org_root_path = f"C:/Users/delai/source/repos/Fence/logs/videos/{self._config.module_id}/{self._config.camera_id}"
+        video_org_root_path = f"{self._config.log_root}/{self._config.module_id}/{self._config.camera_id}"
         if not os.path.exists(video_org_root_path):
             os.makedirs(video_org_root_path)
 
@@ -123,7 +159,7 @@ class EventHandler(EventHandlerBase):
             "image_uri": image_uri,
             "msgType": self._config.msgType
         }
-        requests.post(self._config.post_event_url, json=event_message, timeout=2)
+        self._outbox.put(self._config.post_event_url, event_message)
 
     def _post_video_event(self, timestamp, video_uri):
         event_message = {
@@ -135,31 +171,69 @@ class EventHandler(EventHandlerBase):
             'dns': f'http://{get_ipv4_address()}:8005'
         }
         
-        requests.post(self._config.post_event_url + '/video', json=event_message, timeout=2)
+        self._outbox.put(self._config.post_event_url + '/video', event_message)
         
 
-    def post_frame(self, frame):
-        if frame is None:
-            return
-        frame = image_resize(frame, self._config.frame_stream_size)
-        frame_bytes = image_to_bytes(frame)
-        try:
-            response = requests.post(self._config.post_frame_url, data=frame_bytes, timeout=1)
-        except Exception as e:
-            print("Lỗi khi gửi frame:", str(e))
+    def post_frame(self, frame, capture_time=None):
+        self._frame_publisher.publish(frame, capture_time)
+
+    def get_stats(self):
+        return {
+            'preview': self._frame_publisher.stats(),
+            'snapshots': self._snapshot_lane.stats(),
+            'clip_events': self._clip_event_lane.stats(),
+            # the outbox is shared by every camera; inference reports and resets it once
+            'outbox': self._outbox.stats(reset=False),
+            'video_queue_depth': self._clip_encoder.depth,
+            'video_frames_dropped': self._clip_encoder.dropped_count
+        }
 
     def update_video(self, frame_org, frame_log):
-        self._queue_video.append((frame_org, frame_log))
+        self.start_video()
+        self.write_video_frames(list(zip(frame_org, frame_log)))
+        self.finish_video()
 
-    def update(self, frame_org, frame_log):
-        self._queue.append((frame_org, frame_log))
-
-    def _process(self, frame_org, frame_log):
+    def start_video(self, fps=None):
+        if not self._config.post_event_url:
+            return
+        print('Starting handle video')
         timestamp = int(time.time())
-        event_image_info = self._get_event_image_info(timestamp)
+        event_video_info = self._get_event_video_info(timestamp)
+        self._clip_encoder.start(
+            outputs=[
+                (event_video_info.video_log_path, self._config.frame_log_size),
+                (event_video_info.video_org_path, self._config.frame_org_size)
+            ],
+            fps=fps or self.fps,
+            context=(timestamp, event_video_info))
+
+    def write_video_frame(self, frame_org, frame_log, block=False):
+        self._clip_encoder.write((frame_log, frame_org), block=block)
+
+    def write_video_frames(self, frames: list):
+        """frames: (frame_org, frame_log) pairs, handed to the encoder thread without copying or waiting."""
+        self._clip_encoder.write_many([(frame_log, frame_org) for frame_org, frame_log in frames])
+
+    def finish_video(self):
+        self._clip_encoder.finish()
+
+    def _on_video_finished(self, context):
+        self._clip_event_lane.put(context)
+
+    def _process_clip_event(self, context):
+        timestamp, event_video_info = context
+        # historical
+        self._post_video_event(timestamp, event_video_info.video_log_uri)
+
+    def update(self, frame_org, frame_log, capture_time=None):
+        timestamp = time.time()
+        interval = self._config.snapshot_coalesce_interval
+        key = int(timestamp // interval) if interval else None
+        self._snapshot_lane.put((int(timestamp), frame_org, frame_log, capture_time), key=key)
 
-        frame_log = image_resize(frame_log, self._config.frame_log_size)
-        frame_org = image_resize(frame_org, self._config.frame_org_size)
+    def _process_snapshot(self, snapshot):
+        timestamp, frame_org, frame_log, capture_time = snapshot
+        event_image_info = self._get_event_image_info(timestamp)
 
         if not self._config.post_event_url:
             return 
@@ -167,41 +241,7 @@ class EventHandler(EventHandlerBase):
         print('error')
 
         self._post_event(timestamp, event_image_info.image_log_uri)
+        frame_age.record(self._config.camera_id, 'event', capture_time)
         
         # save_image(event_image_info.image_log_path, frame_log)
         # save_image(event_image_info.image_org_path, frame_org)
-        
-    def _process_video(self, frames_org, frames_log):
-        print('Starting handle video')
-        
-        timestamp = int(time.time())
-        event_video_info = self._get_event_video_info(timestamp)
-        
-        if not self._config.post_event_url:
-            return 
-        
-        # historical 
-        self._post_video_event(timestamp, event_video_info.video_log_uri)
-        
-        save_video(
-            path=event_video_info.video_log_path, 
-            frames=frames_log, 
-            fps=self.fps, 
-            size=self._config.frame_log_size)
-        
-        save_video(
-            path=event_video_info.video_org_path, 
-            frames=frames_org, 
-            fps=self.fps, 
-            size=self._config.frame_org_size)
-        
-    def _run(self):
-        while True:
-            if len(self._queue) > 0:
-                frame_org, frame_log = self._queue.pop(0)
-                self._process(frame_org, frame_log)
-            if len(self._queue_video) > 0:
-                frames_org, frames_log = self._queue_video.pop(0)
-                self._process_video(frames_org, frames_log)
-                
-            time.sleep(0.02)
\ No newline at end of file
@@ -0,0 +1,106 @@
+import time
+import threading
+import traceback
+from collections import deque
+
+POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+class EventLane:
+    """
+    Bounded queue with its own worker thread calling handler(item).
+
+    When the queue is full, put() waits ("block"), evicts the oldest item
+    ("drop_oldest") or discards the new one ("drop_newest"). Items put with
+    a key replace a queued item with the same key instead of queueing
+    behind it, which keeps only the newest of e.g. one second's snapshots.
+    """
+
+    def __init__(self, name, handler, maxsize=16, policy="drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown queue policy {policy}")
+        self._name = name
+        self._handler = handler
+        self._maxsize = maxsize
+        self._policy = policy
+        self._cond = threading.Condition()
+        self._items = deque()
+        self.processed_count = 0
+        self.dropped_count = 0
+        self.coalesced_count = 0
+        self.failed_count = 0
+        self._max_depth = 0
+        self._wait_total = 0
+        self._wait_max = 0
+        self._process_total = 0
+        self._process_max = 0
+        self._t = threading.Thread(target=self._run, name=name)
+        self._t.daemon = True
+        self._t.start()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, key=None):
+        """Queue item; returns False if it was dropped."""
+        with self._cond:
+            if key is not None:
+                for index, (queued_key, _, _) in enumerate(self._items):
+                    if queued_key == key:
+                        self._items[index] = (key, item, time.time())
+                        self.coalesced_count += 1
+                        return True
+            if len(self._items) >= self._maxsize:
+                if self._policy == "block":
+                    self._cond.wait_for(lambda: len(self._items) < self._maxsize)
+                elif self._policy == "drop_oldest":
+                    self._items.popleft()
+                    self.dropped_count += 1
+                else:
+                    self.dropped_count += 1
+                    return False
+            self._items.append((key, item, time.time()))
+            self._max_depth = max(self._max_depth, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def stats(self, reset=True):
+        processed = max(1, self.processed_count)
+        stats = {
+            'depth': len(self._items),
+            'max_depth': self._max_depth,
+            'processed': self.processed_count,
+            'dropped': self.dropped_count,
+            'coalesced': self.coalesced_count,
+            'failed': self.failed_count,
+            'wait_avg_ms': self._wait_total / processed * 1000,
+            'wait_max_ms': self._wait_max * 1000,
+            'process_avg_ms': self._process_total / processed * 1000,
+            'process_max_ms': self._process_max * 1000
+        }
+        if reset:
+            self._max_depth = len(self._items)
+            self._wait_max = 0
+            self._process_max = 0
+        return stats
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._items) > 0)
+                _, item, put_time = self._items.popleft()
+                self._cond.notify_all()
+
+            start_time = time.time()
+            try:
+                self._handler(item)
+            except Exception:
+                self.failed_count += 1
+                traceback.print_exc()
+            end_time = time.time()
+
+            self.processed_count += 1
+            self._wait_total += start_time - put_time
+            self._wait_max = max(self._wait_max, start_time - put_time)
+            self._process_total += end_time - start_time
+            self._process_max = max(self._process_max, end_time - start_time)
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import requests
+
+
+class EventOutbox:
+    """
+    Durable outbox for event POSTs.
+
+    put() appends the message to a local SQLite table and returns at once.
+    A delivery thread drains due messages in batches over one keep-alive
+    session and deletes each batch's delivered rows in one transaction.
+    A failed message stays in the table and is retried with exponential
+    backoff, so delivery is at-least-once and survives backend outages and
+    restarts. A connection error ends the batch early since the rest would
+    fail the same way, and does not count as an attempt.
+
+    A message the backend rejects with a 4xx (other than 408 and 429), or
+    that fails max_attempts times, moves to the dead_letter table, which
+    keeps the newest max_dead_letters rows for inspection.
+    """
+
+    def __init__(self, path, batch_size=50, timeout=2, min_backoff=1.0, max_backoff=60.0, max_attempts=10,
+                 max_dead_letters=10000):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._path = path
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+        self._max_attempts = max_attempts
+        self._max_dead_letters = max_dead_letters
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, payload TEXT NOT NULL, "
+            "created REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "id INTEGER PRIMARY KEY, url TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL, "
+            "attempts INTEGER NOT NULL, failed REAL NOT NULL, error TEXT)")
+        self._db.commit()
+        self._session = requests.Session()
+        self._wakeup = threading.Event()
+        self.delivered_count = 0
+        self.failed_count = 0
+        self.dead_count = 0
+        self._latency_total = 0
+        self._latency_max = 0
+        self._t = threading.Thread(target=self._run)
+        self._t.daemon = True
+        self._t.start()
+
+    def put(self, url, message: dict):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT INTO outbox (url, payload, created, next_attempt) VALUES (?, ?, ?, ?)",
+                             (url, json.dumps(message), now, now))
+            self._db.commit()
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_letters(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def stats(self, reset=True):
+        latency_avg = self._latency_total / self.delivered_count if self.delivered_count > 0 else 0
+        stats = {
+            'pending': self.pending(),
+            'delivered': self.delivered_count,
+            'failed': self.failed_count,
+            'dead': self.dead_count,
+            'latency_avg_ms': latency_avg * 1000,
+            'latency_max_ms': self._latency_max * 1000
+        }
+        if reset:
+            self._latency_max = 0
+        return stats
+
+    def _due(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, url, payload, created, attempts FROM outbox WHERE next_attempt <= ? ORDER BY id LIMIT ?",
+                (time.time(), self._batch_size)).fetchall()
+
+    def _next_due_in(self):
+        with self._lock:
+            next_attempt = self._db.execute("SELECT MIN(next_attempt) FROM outbox").fetchone()[0]
+        if next_attempt is None:
+            return None
+        return max(0, next_attempt - time.time())
+
+    def _deliver(self, url, payload):
+        response = self._session.post(url, data=payload, headers={'Content-Type': 'application/json'},
+                                      timeout=self._timeout)
+        response.raise_for_status()
+
+    def _is_rejected(self, error):
+        """True for a 4xx answer: the message itself is wrong and retrying cannot help."""
+        response = getattr(error, 'response', None)
+        if response is None:
+            return False
+        return 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+    def _deliver_batch(self, rows):
+        delivered = []
+        failed = []
+        dead = []
+        unreachable = False
+        for row in rows:
+            row_id, url, payload, created, attempts = row
+            try:
+                self._deliver(url, payload)
+            except requests.exceptions.ConnectionError as e:
+                print("Lỗi khi gửi sự kiện:", url, str(e))
+                # the backend is unreachable; leave the rest of the batch for the next attempt
+                unreachable = True
+                break
+            except Exception as e:
+                print("Lỗi khi gửi sự kiện:", url, str(e))
+                if self._is_rejected(e) or attempts + 1 >= self._max_attempts:
+                    dead.append((row, str(e)))
+                else:
+                    failed.append((row_id, attempts))
+                continue
+            delivered.append(row_id)
+            latency = time.time() - created
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+        now = time.time()
+        with self._lock:
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in delivered])
+            self._db.executemany(
+                "UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?",
+                [(attempts + 1, now + min(self._max_backoff, self._min_backoff * 2 ** attempts), row_id)
+                 for row_id, attempts in failed])
+            if len(dead) > 0:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO dead_letter (id, url, payload, created, attempts, failed, error) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(row_id, url, payload, created, attempts + 1, now, error)
+                     for (row_id, url, payload, created, attempts), error in dead])
+                self._db.executemany("DELETE FROM outbox WHERE id = ?", [(row[0],) for row, _ in dead])
+                self._db.execute(
+                    "DELETE FROM dead_letter WHERE id NOT IN (SELECT id FROM dead_letter ORDER BY id DESC LIMIT ?)",
+                    (self._max_dead_letters,))
+            self._db.commit()
+        self.delivered_count += len(delivered)
+        self.failed_count += len(failed) + len(dead) + (1 if unreachable else 0)
+        self.dead_count += len(dead)
+        return not unreachable
+
+    def _run(self):
+        backoff = 0
+        while True:
+            rows = self._due()
+            if len(rows) > 0:
+                if not self._deliver_batch(rows):
+                    # new events must not trigger a connect attempt each while the backend is down
+                    backoff = min(self._max_backoff, max(self._min_backoff, backoff * 2))
+                    time.sleep(backoff)
+                    continue
+                backoff = 0
+                if len(rows) == self._batch_size:
+                    continue
+            self._wakeup.wait(self._next_due_in())
+            self._wakeup.clear()
+
+
+_outboxes = {}
+_outboxes_lock = threading.Lock()
+
+
+def get_event_outbox(path, batch_size=50, max_attempts=10) -> EventOutbox:
+    """The process-wide outbox for path, shared by every camera's EventHandler."""
+    path = os.path.abspath(path)
+    with _outboxes_lock:
+        if path not in _outboxes:
+            _outboxes[path] = EventOutbox(path, batch_size, max_attempts=max_attempts)
+        return _outboxes[path]
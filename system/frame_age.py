@@ -0,0 +1,97 @@
+import time
+import threading
+from collections import deque
+
+from system.metrics import metrics
+
+# stages in pipeline order; each is the age of the frame, from its capture
+# stamp, when it got there
+STAGES = ('fetched', 'dequeued', 'decision', 'actuation', 'event', 'preview')
+
+
+class FrameAgeTracker:
+    """
+    Rolling worst-case frame age per camera and stage.
+
+    Every record keeps the worst age seen in its one-second slot for the
+    last window seconds, so reports show the recent worst case without
+    keeping every sample. Ages also go to the metrics histograms as
+    capture_to_<stage> when metrics are enabled.
+    """
+
+    def __init__(self, window=60, stale_threshold=1.0):
+        self._window = window
+        self._stale_threshold = stale_threshold
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._last = {}
+
+    def record(self, camera_id, stage, capture_time, now=None):
+        if capture_time is None:
+            return
+        now = now or time.time()
+        age = now - capture_time
+        second = int(now)
+        key = (camera_id, stage)
+        with self._lock:
+            slots = self._slots.get(key)
+            if slots is None:
+                slots = self._slots[key] = deque()
+            if len(slots) > 0 and slots[-1][0] == second:
+                if age > slots[-1][1]:
+                    slots[-1] = (second, age)
+            else:
+                slots.append((second, age))
+                while slots[0][0] <= second - self._window:
+                    slots.popleft()
+            self._last[key] = age
+        metrics.observe(camera_id, f'capture_to_{stage}', age)
+
+    def worst(self, camera_id, stage):
+        """Worst age in seconds over the window, None if nothing was recorded."""
+        oldest = int(time.time()) - self._window
+        with self._lock:
+            ages = [age for second, age in self._slots.get((camera_id, stage), ()) if second > oldest]
+        return max(ages) if len(ages) > 0 else None
+
+    def report(self, camera_id=None):
+        """{camera_id: {stage: {'worst_ms', 'last_ms'}}} over the window."""
+        with self._lock:
+            keys = list(self._slots)
+        report = {}
+        for camera, stage in sorted(keys, key=lambda key: (key[0], STAGES.index(key[1]) if key[1] in STAGES else len(STAGES))):
+            if camera_id is not None and camera != camera_id:
+                continue
+            worst = self.worst(camera, stage)
+            if worst is None:
+                continue
+            report.setdefault(camera, {})[stage] = {
+                'worst_ms': worst * 1000,
+                'last_ms': self._last[(camera, stage)] * 1000
+            }
+        return report
+
+    def stale_cameras(self):
+        """
+        Cameras whose worst decision age exceeds stale_threshold, with the
+        part of the pipeline that added most of it: 'fetch' (camera to
+        frame reader), 'queue' (waiting for the main loop and the pipeline
+        thread) or 'processing' (LogicHandler itself).
+        """
+        stale = {}
+        for camera_id, stages in self.report().items():
+            decision = stages.get('decision')
+            if decision is None or decision['worst_ms'] < self._stale_threshold * 1000:
+                continue
+            fetched = stages.get('fetched', {}).get('worst_ms', 0)
+            dequeued = stages.get('dequeued', {}).get('worst_ms', fetched)
+            parts = {
+                'fetch': fetched,
+                'queue': dequeued - fetched,
+                'processing': decision['worst_ms'] - dequeued
+            }
+            stale[camera_id] = {'worst_ms': decision['worst_ms'], 'cause': max(parts, key=parts.get)}
+        return stale
+
+
+frame_age = FrameAgeTracker()
@@ -0,0 +1,77 @@
+import time
+import threading
+
+import requests
+
+from system.image_utils import image_resize, image_to_bytes
+from system.mailbox import Mailbox
+from system.metrics import metrics
+from system.frame_age import frame_age
+
+
+class FramePublisher:
+    """
+    Posts preview frames to stream-manage from a background thread.
+
+    publish() only drops the frame into a latest-wins mailbox, so a slow
+    endpoint makes the publisher skip frames instead of stalling detection.
+    Posts reuse one keep-alive session.
+    """
+
+    def __init__(self, url, frame_size=None, quality=70, timeout=1, camera_id=None):
+        self._url = url
+        self._camera_id = camera_id
+        self._frame_size = frame_size
+        self._quality = quality
+        self._timeout = timeout
+        self._mailbox = Mailbox()
+        self._session = requests.Session()
+        self.published_count = 0
+        self.failed_count = 0
+        self._latency_total = 0
+        self._latency_max = 0
+        self._t = threading.Thread(target=self._run)
+        self._t.daemon = True
+        self._t.start()
+
+    def publish(self, frame, capture_time=None):
+        if frame is None:
+            return
+        self._mailbox.put((frame, capture_time))
+
+    def stats(self, reset=True):
+        latency_avg = self._latency_total / self.published_count if self.published_count > 0 else 0
+        stats = {
+            'published': self.published_count,
+            'dropped': self._mailbox.dropped_count,
+            'failed': self.failed_count,
+            'latency_avg_ms': latency_avg * 1000,
+            'latency_max_ms': self._latency_max * 1000
+        }
+        if reset:
+            self._latency_max = 0
+        return stats
+
+    def _post(self, frame):
+        with metrics.timer(self._camera_id, 'jpeg_encode'):
+            frame = image_resize(frame, self._frame_size)
+            frame_bytes = image_to_bytes(frame, self._quality)
+        with metrics.timer(self._camera_id, 'post_frame'):
+            self._session.post(self._url, data=frame_bytes, timeout=self._timeout)
+
+    def _run(self):
+        while True:
+            frame, capture_time = self._mailbox.get()
+            start_time = time.time()
+            try:
+                self._post(frame)
+            except Exception as e:
+                self.failed_count += 1
+                print("Lỗi khi gửi frame:", str(e))
+                continue
+            end_time = time.time()
+            latency = end_time - start_time
+            frame_age.record(self._camera_id, 'preview', capture_time, end_time)
+            self.published_count += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
@@ -1,50 +1,281 @@
 import time
+import collections
 import requests
 import threading
 import cv2
 import numpy as np
 from system.utils import get_ipv4_address
+from system.image_utils import get_reduced_decode_flag
+from system.metrics import metrics
+from system.frame_age import frame_age
 
 CAMERA_API = f"http://{get_ipv4_address()}:8005/stream-manage/lastframe"
+CAMERA_STREAM_API = f"http://{get_ipv4_address()}:8005/stream-manage/stream"
 def url_last_frame(camera_id):
     return f"{CAMERA_API}/{camera_id}"
 
+def url_stream(camera_id):
+    return f"{CAMERA_STREAM_API}/{camera_id}"
+
+def get_multipart_boundary(content_type):
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            return value.strip('"')
+    return None
+
+def _find_boundary_line(buffer, name, start=0):
+    """Offset of the first line at or after start made of two or more dashes and name, -1 if none."""
+    index = buffer.find(name, start)
+    while index >= 0:
+        line_start = buffer.rfind(b"\n", 0, index) + 1
+        prefix = buffer[line_start:index]
+        if len(prefix) >= 2 and not prefix.strip(b"-"):
+            return line_start
+        index = buffer.find(name, index + 1)
+    return -1
+
+def read_mjpeg_frames(stream, boundary, chunk_size=65536):
+    """
+    Yield the payload of every part of a multipart/x-mixed-replace stream,
+    read with stream.read1 so nothing waits for more than has arrived.
+
+    Parts with a Content-Length header are read in one go. Otherwise the
+    payload ends at the JPEG end-of-image marker (FFD9) or, for parts that
+    have none, at the next boundary line, so a frame is released as soon as
+    it is complete rather than when the next one starts. A JPEG carrying an
+    EXIF thumbnail would be cut at the thumbnail's marker; the cameras
+    stream plain encoder output.
+    """
+    name = boundary.lstrip("-").encode()
+    buffer = bytearray()
+
+    def fill():
+        chunk = stream.read1(chunk_size)
+        buffer.extend(chunk)
+        return len(chunk) > 0
+
+    while True:
+        # skip to the line after the next boundary
+        while True:
+            line_start = _find_boundary_line(buffer, name)
+            line_end = buffer.find(b"\n", line_start) if line_start >= 0 else -1
+            if line_end >= 0:
+                del buffer[:line_end + 1]
+                break
+            if line_start < 0:
+                # keep enough to match a boundary split across reads
+                del buffer[:max(0, len(buffer) - len(name) - 2)]
+            if not fill():
+                return
+        # part headers
+        content_length = None
+        while True:
+            line_end = buffer.find(b"\n")
+            if line_end < 0:
+                if not fill():
+                    return
+                continue
+            line = bytes(buffer[:line_end]).strip()
+            del buffer[:line_end + 1]
+            if not line:
+                break
+            key, _, value = line.partition(b":")
+            if key.strip().lower() == b"content-length":
+                content_length = int(value.strip())
+        if content_length is not None:
+            while len(buffer) < content_length:
+                if not fill():
+                    return
+            data = bytes(buffer[:content_length])
+            del buffer[:content_length]
+            yield data
+            continue
+        scan_from = 0
+        while True:
+            eoi = buffer.find(b"\xff\xd9", scan_from)
+            next_part = _find_boundary_line(buffer, name, scan_from)
+            if eoi >= 0 and (next_part < 0 or eoi < next_part):
+                data = bytes(buffer[:eoi + 2])
+                del buffer[:eoi + 2]
+                break
+            if next_part >= 0:
+                data = bytes(buffer[:next_part])
+                del buffer[:next_part]
+                # the line break before the boundary belongs to the delimiter
+                data = data[:-2] if data.endswith(b"\r\n") else data[:-1] if data.endswith(b"\n") else data
+                break
+            scan_from = max(0, len(buffer) - len(name) - 2)
+            if not fill():
+                return
+        yield data
+
+class FrameEntry:
+    """A fetched frame kept as compressed bytes and decoded once, on first access."""
+
+    def __init__(self, seq, capture_time, data, decoder):
+        self.seq = seq
+        self.capture_time = capture_time
+        self._data = data
+        self._decoder = decoder
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def decoded(self):
+        return self._data is None
+
+    @property
+    def frame(self):
+        with self._lock:
+            if self._data is not None:
+                self._frame = self._decoder(self._data)
+                self._data = None
+            return self._frame
+
 class Camera:
-    def __init__(self, camera_id, fps=25, rotate=False, size=None):
+    def __init__(self, camera_id, fps=25, rotate=False, size=None, mode="poll", stream_url=None, retry_interval=5,
+                 ring_size=4, on_new_frame=None, frame_url=None):
+        """
+        mode: "poll" requests /lastframe for every frame, "mjpeg" keeps one
+        multipart stream open and falls back to polling while it is down.
+        frame_url, stream_url: override the stream-manage lastframe and stream URLs.
+        ring_size: number of recent (seq, capture_time, frame) entries kept.
+        """
         self._camera_id = camera_id
-        self._last_frame = None
+        self._last_entry = None
+        self._frames = collections.deque(maxlen=ring_size)
+        self._fetched_count = 0
+        self._decoded_count = 0
+        self._skipped_count = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._on_new_frame = on_new_frame
         self._fps = fps
         self._rotate = rotate
         self._size = size
+        self._mode = mode
+        self._stream_url = stream_url or url_stream(camera_id)
+        self._frame_url = frame_url or url_last_frame(camera_id)
+        self._retry_interval = retry_interval
 
     def last_frame(self):
-        return self._last_frame
+        entry = self._last_entry
+        return entry.frame if entry is not None else None
+
+    def stats(self):
+        return {
+            'fetched': self._fetched_count,
+            'decoded': self._decoded_count,
+            'skipped': self._skipped_count
+        }
+
+    def last_entry(self):
+        with self._cond:
+            return self._frames[-1] if len(self._frames) > 0 else None
+
+    def get_new_frames(self, since=0):
+        """Entries still in the ring with a sequence number above since, oldest first."""
+        with self._cond:
+            return [entry for entry in self._frames if entry.seq > since]
+
+    def wait_new_frame(self, since=0, timeout=None):
+        """Block until a frame newer than since arrives; returns the newest entry or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > since, timeout):
+                return None
+            return self._frames[-1]
+
+    def _push_frame(self, data, capture_time=None):
+        """capture_time: when the frame was requested, defaults to its arrival."""
+        if data is None:
+            self._last_entry = None
+            return
+        now = time.time()
+        capture_time = capture_time or now
+        with self._cond:
+            self._seq += 1
+            self._fetched_count += 1
+            if len(self._frames) == self._frames.maxlen and not self._frames[0].decoded:
+                # evicted without anyone looking at it, the decode was never paid for
+                self._skipped_count += 1
+            entry = FrameEntry(self._seq, capture_time, data, self._decode)
+            self._frames.append(entry)
+            self._last_entry = entry
+            self._cond.notify_all()
+        frame_age.record(self._camera_id, 'fetched', capture_time, now)
+        if self._on_new_frame is not None:
+            self._on_new_frame(self._camera_id)
 
     def update_last_frame(self):
-        self._last_frame = self.get_frame_from_http_api()
+        # lastframe returns the camera's newest frame, so the request time is the closest capture stamp we have
+        capture_time = time.time()
+        self._push_frame(self.get_bytes_from_http_api(), capture_time)
 
-    def get_frame_from_http_api(self):
+    def get_bytes_from_http_api(self):
         try:
-            resp = requests.get(url_last_frame(self._camera_id), stream=True, timeout=2).raw
+            with metrics.timer(self._camera_id, 'fetch'):
+                resp = requests.get(self._frame_url, stream=True, timeout=2).raw
+                return resp.read()
         except:
             return None
-        start_time = time.time()
-        image = np.asarray(bytearray(resp.read()), dtype="uint8")
-        image = cv2.imdecode(image, cv2.IMREAD_COLOR)
+
+    def get_frame_from_http_api(self):
+        data = self.get_bytes_from_http_api()
+        if data is None:
+            return None
+        return self._decode(data)
+
+    def _decode(self, data):
+        self._decoded_count += 1
+        flag = cv2.IMREAD_COLOR
+        if self._size is not None:
+            # decode straight at (or just above) the working size, the size is taken before rotation
+            decode_size = self._size[::-1] if self._rotate else self._size
+            flag = get_reduced_decode_flag(data, decode_size)
+        with metrics.timer(self._camera_id, 'decode'):
+            image = np.frombuffer(data, dtype="uint8")
+            image = cv2.imdecode(image, flag)
+        if image is None:
+            return None
         if self._rotate:
             image = cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        if self._size is not None:
-            image = cv2.resize(image, self._size)
+        if self._size is not None and image.shape[1::-1] != tuple(self._size):
+            with metrics.timer(self._camera_id, 'resize'):
+                image = cv2.resize(image, self._size)
         return image
 
-    def update_job(self):
-        while True:
+    def poll_job(self, duration=None):
+        start_job = time.time()
+        while duration is None or time.time() - start_job < duration:
             start_time = time.time()
             self.update_last_frame()
             end_time = time.time()
             sleep_time = max(0, 1/self._fps - (end_time - start_time))
             time.sleep(sleep_time)
 
+    def stream_job(self):
+        """Read frames from one long-lived MJPEG connection until it drops."""
+        with requests.get(self._stream_url, stream=True, timeout=(2, 10)) as resp:
+            resp.raise_for_status()
+            boundary = get_multipart_boundary(resp.headers.get("Content-Type", ""))
+            if boundary is None:
+                raise ValueError(f"{self._camera_id}: stream is not multipart")
+            # urllib3's read1 returns what has arrived; a BufferedReader over it would wait for a full buffer
+            for data in read_mjpeg_frames(resp.raw, boundary):
+                self._push_frame(data)
+
+    def update_job(self):
+        if self._mode != "mjpeg":
+            self.poll_job()
+            return
+        while True:
+            try:
+                self.stream_job()
+            except Exception as e:
+                print(f"{self._camera_id}: mjpeg stream unavailable ({e}), polling instead")
+            self.poll_job(duration=self._retry_interval)
+
     def start(self):
         self._thread = threading.Thread(target=self.update_job)
         self._thread.daemon = True
@@ -54,15 +285,20 @@ class FrameReader:
     def __init__(self, camera_ids: list, camera_params: dict = {}):
         self._cameara_ids = camera_ids
         self._cameara_params = camera_params
+        self._cond = threading.Condition()
         self._init_camera()
 
     def _init_camera(self):
         self._cameras = {}
         for camera_id in self._cameara_ids:
             camera_param = self._cameara_params.get(camera_id, {})
-            self._cameras[camera_id] = Camera(camera_id, **camera_param)
+            self._cameras[camera_id] = Camera(camera_id, on_new_frame=self._notify_new_frame, **camera_param)
             self._cameras[camera_id].start()
 
+    def _notify_new_frame(self, camera_id):
+        with self._cond:
+            self._cond.notify_all()
+
     def get_last_frames(self):
         frames = {}
         for camera_id, camera in self._cameras.items():
@@ -72,6 +308,31 @@ class FrameReader:
             frames[camera_id] = last_frame
         return frames
 
+    def get_stats(self):
+        return {camera_id: camera.stats() for camera_id, camera in self._cameras.items()}
+
+    def get_new_frames(self, since: dict = None):
+        """
+        Newest entry of every camera that has a frame not seen yet.
+
+        since maps camera_id to the last sequence number consumed; older
+        unseen entries are skipped since only the newest frame is processed.
+        """
+        since = since or {}
+        frames = {}
+        for camera_id, camera in self._cameras.items():
+            entry = camera.last_entry()
+            if entry is None or entry.seq <= since.get(camera_id, 0):
+                continue
+            frames[camera_id] = entry
+        return frames
+
+    def wait_for_frames(self, since: dict = None, timeout=None):
+        """Like get_new_frames, but sleeps until at least one camera has a new frame or timeout passes."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.get_new_frames(since)) > 0, timeout)
+        return self.get_new_frames(since)
+
 if __name__ == "__main__":
     time.sleep(2)
     camera = Camera("camera-1")
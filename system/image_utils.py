@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
 from matplotlib import path
+from system.zone_overlay import get_zone_overlay
 
 AREA_COLOR = (0, 0, 100)
 TRANSPARENT_SCORE = 0.5
@@ -14,6 +15,41 @@ def image_resize(frame, output_size=None):
         return cv2.resize(frame, output_size)
     return frame
 
+def get_jpeg_size(data):
+    """Read (width, height) from the SOF header of JPEG bytes without decoding; None if not found."""
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+def get_reduced_decode_flag(data, output_size):
+    """
+    Pick the largest IMREAD_REDUCED_COLOR_* scale that still decodes at or
+    above output_size, so that at most one downscale is left afterwards.
+    """
+    source_size = get_jpeg_size(data)
+    if source_size is None:
+        return cv2.IMREAD_COLOR
+    width, height = source_size
+    for scale, flag in ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if width // scale >= output_size[0] and height // scale >= output_size[1]:
+            return flag
+    return cv2.IMREAD_COLOR
+
 def save_image(path, frame):
     cv2.imwrite(path, frame)
     
@@ -34,21 +70,17 @@ def save_video(path, frames, fps=30, size=(1920, 1080)):
 
     out.release()
     
-def image_to_bytes(frame):
+def image_to_bytes(frame, quality=70):
     _, frame = cv2.imencode(
         ".jpg",
         frame,
-        params=(cv2.IMWRITE_JPEG_QUALITY, 70),
+        params=(cv2.IMWRITE_JPEG_QUALITY, quality),
     )
     return frame.tobytes()
 
 def draw_area(area_config, image):
-    overlay = image.copy()
-    area_config_numpy = np.array(area_config)
-    cv2.fillPoly(overlay, pts=[area_config_numpy], color=AREA_COLOR)
-    overlay = cv2.polylines(overlay, [area_config_numpy.reshape((-1, 1, 2))], True, LINE_AREA_COLOR, 2)
-    image = cv2.addWeighted(overlay, TRANSPARENT_SCORE, image, 1 - TRANSPARENT_SCORE, 0)
-    return image
+    overlay = get_zone_overlay(area_config, image.shape[1::-1], TRANSPARENT_SCORE, LINE_AREA_COLOR)
+    return overlay.draw(image.copy(), AREA_COLOR)
 
 def plot_detection_result(box, frame, color=(0, 255, 0), label=None, txt_color=(255, 255, 255), line_width=None):
     p1, p2 = (int(box[0]), int(box[1])), (int(box[2]), int(box[3]))
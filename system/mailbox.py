@@ -0,0 +1,36 @@
+import threading
+
+
+class Mailbox:
+    """
+    One-slot, latest-wins mailbox.
+
+    Putting into a full slot replaces the older item instead of queueing it,
+    so a slow consumer always picks up the newest item and never a backlog.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self.put_count = 0
+        self.dropped_count = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._has_item:
+                self.dropped_count += 1
+            self._item = item
+            self._has_item = True
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Wait for the next item; returns None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has_item, timeout):
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
@@ -0,0 +1,173 @@
+import time
+import threading
+from bisect import bisect_left
+
+# upper bounds in seconds, from 0.1 ms to 5 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; quantiles interpolate inside the bucket."""
+
+    def __init__(self, buckets=BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        # one count per bucket plus the +Inf overflow
+        self._counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, seconds):
+        index = bisect_left(self._buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def merge(self, other: 'Histogram'):
+        """Add other's samples, e.g. to aggregate one stage over all cameras."""
+        with other._lock:
+            counts, count, total = list(other._counts), other.count, other.sum
+        with self._lock:
+            self._counts = [a + b for a, b in zip(self._counts, counts)]
+            self.count += count
+            self.sum += total
+
+    def cumulative(self):
+        """(upper bound, cumulative count) per bucket, the last bound being inf."""
+        with self._lock:
+            counts = list(self._counts)
+        total = 0
+        result = []
+        for bound, count in zip(self._buckets + (float('inf'),), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        cumulative = self.cumulative()
+        total = cumulative[-1][1]
+        if total == 0:
+            return 0
+        rank = q * total
+        lower, below = 0, 0
+        for bound, count in cumulative:
+            if count >= rank:
+                if bound == float('inf'):
+                    return lower
+                inside = count - below
+                return lower + (bound - lower) * (rank - below) / inside if inside > 0 else bound
+            lower, below = bound, count
+        return lower
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_start_time')
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._histogram.observe(time.perf_counter() - self._start_time)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Per-camera, per-stage latency histograms.
+
+    Disabled by default; while disabled timer() hands out a shared no-op
+    context manager and observe() returns at once, so instrumented code
+    pays one attribute check per stage.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def histogram(self, camera_id, stage) -> Histogram:
+        key = (camera_id, stage)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def timer(self, camera_id, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(camera_id, stage))
+
+    def observe(self, camera_id, stage, seconds):
+        if self.enabled:
+            self.histogram(camera_id, stage).observe(seconds)
+
+    def stages(self):
+        """Every stage's histogram merged over all cameras."""
+        stages = {}
+        for (camera_id, stage), histogram in sorted(self._histograms.items()):
+            stages.setdefault(stage, Histogram()).merge(histogram)
+        return stages
+
+    def summary(self, camera_id=None):
+        """{camera_id: {stage: p50/p95/p99 in ms and count}}"""
+        summary = {}
+        for (camera, stage), histogram in sorted(self._histograms.items()):
+            if camera_id is not None and camera != camera_id:
+                continue
+            summary.setdefault(camera, {})[stage] = {
+                'p50_ms': histogram.quantile(0.5) * 1000,
+                'p95_ms': histogram.quantile(0.95) * 1000,
+                'p99_ms': histogram.quantile(0.99) * 1000,
+                'count': histogram.count
+            }
+        return summary
+
+    def render(self):
+        """Prometheus text exposition of every histogram."""
+        lines = [
+            "# HELP fence_stage_seconds Time spent per pipeline stage.",
+            "# TYPE fence_stage_seconds histogram"
+        ]
+        for (camera_id, stage), histogram in sorted(self._histograms.items()):
+            labels = f'camera="{camera_id}",stage="{stage}"'
+            for bound, count in histogram.cumulative():
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'fence_stage_seconds_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f'fence_stage_seconds_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'fence_stage_seconds_count{{{labels}}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def metrics_app(environ, start_response):
+    """WSGI app serving GET /metrics, meant as the fallback app next to socket.io."""
+    if environ.get('PATH_INFO') != '/metrics':
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'Not Found']
+    body = metrics.render().encode()
+    start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
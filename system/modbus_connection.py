@@ -0,0 +1,93 @@
+import time
+import threading
+
+from pyModbusTCP.client import ModbusClient
+from pyModbusTCP.constants import MB_EXCEPT_ERR
+
+
+class ModbusConnection:
+    """
+    One persistent Modbus TCP connection to a PLC endpoint, shared by every
+    reader and writer of that endpoint. Requests are serialised on a lock;
+    a failed request drops the socket and the next open is delayed with an
+    exponential backoff between min_backoff and max_backoff seconds.
+    """
+
+    def __init__(self, host, port=502, timeout=2.0, min_backoff=0.5, max_backoff=10.0):
+        self._client = ModbusClient(host=host, port=port, timeout=timeout, auto_open=False, auto_close=False)
+        self._lock = threading.Lock()
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+        self._backoff = 0
+        self._next_open_time = 0
+        self.connect_count = 0
+        self.error_count = 0
+
+    @property
+    def address(self):
+        return f"{self._client.host}:{self._client.port}"
+
+    def retry_delay(self):
+        """Seconds until the next reconnect attempt is allowed, 0 if connected or due."""
+        if self._client.is_open:
+            return 0
+        return max(0, self._next_open_time - time.time())
+
+    def _open(self):
+        if self._client.is_open:
+            return True
+        if time.time() < self._next_open_time:
+            return False
+        if self._client.open():
+            self._backoff = 0
+            self.connect_count += 1
+            return True
+        print("Không thể kết nối với PLC", self.address)
+        self._fail()
+        return False
+
+    def _fail(self):
+        self.error_count += 1
+        self._client.close()
+        self._backoff = min(self._max_backoff, max(self._min_backoff, self._backoff * 2))
+        self._next_open_time = time.time() + self._backoff
+
+    def _request(self, name, *args):
+        with self._lock:
+            if not self._open():
+                return None
+            try:
+                result = getattr(self._client, name)(*args)
+            except Exception as e:
+                print("Lỗi khi giao tiếp với PLC:", self.address, str(e))
+                self._fail()
+                return None
+            # a Modbus exception reply leaves the socket usable, anything else does not
+            if (result is None or result is False) and self._client.last_error != MB_EXCEPT_ERR:
+                print("Lỗi khi giao tiếp với PLC:", self.address, self._client.last_error_as_txt)
+                self._fail()
+            return result
+
+    def read_coils(self, address, count=1):
+        """Coil values as a list of bools, or None on failure."""
+        return self._request('read_coils', address, count)
+
+    def write_single_coil(self, address, value):
+        """True if the PLC acknowledged the write."""
+        return bool(self._request('write_single_coil', address, value))
+
+    def close(self):
+        with self._lock:
+            self._client.close()
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_modbus_connection(host, port=502, timeout=2.0, min_backoff=0.5, max_backoff=10.0) -> ModbusConnection:
+    key = (host, port)
+    with _connections_lock:
+        if key not in _connections:
+            _connections[key] = ModbusConnection(host, port, timeout, min_backoff, max_backoff)
+        return _connections[key]
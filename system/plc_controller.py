@@ -2,147 +2,190 @@ import time
 import threading
 
 from pydantic import BaseModel
-from pyModbusTCP.client import ModbusClient
+
+from system.modbus_connection import ModbusConnection, get_modbus_connection
+from system.plc_poller import PLCPoller
+from system.frame_age import frame_age
 
 class PLCControllerConfig(BaseModel):
     plc_ip_address: str
     plc_port: int
     plc_address: int
     modbus_address: int
+    timeout: float = 2.0
+    reconnect_min_backoff: float = 0.5
+    reconnect_max_backoff: float = 10.0
+    poll_interval: float = 2.0
+
+
+def get_plc_connection(plc_info: PLCControllerConfig) -> ModbusConnection:
+    return get_modbus_connection(plc_info.plc_ip_address, plc_info.plc_port, plc_info.timeout,
+                                 plc_info.reconnect_min_backoff, plc_info.reconnect_max_backoff)
+
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def get_plc_poller(plc_info: PLCControllerConfig) -> PLCPoller:
+    """The shared poller of the PLC host, polling at the shortest interval any caller asked for."""
+    key = (plc_info.plc_ip_address, plc_info.plc_port)
+    with _pollers_lock:
+        if key not in _pollers:
+            _pollers[key] = PLCPoller(get_plc_connection(plc_info), plc_info.poll_interval)
+        poller = _pollers[key]
+        poller.interval = min(poller.interval, plc_info.poll_interval)
+        return poller
+
 
 class PLCControllerBase:
-    def __init__(self, plc_info: PLCControllerConfig):
+    def __init__(self, plc_info: PLCControllerConfig, camera_id=None):
         pass
 
-    def turn_on(self):
+    def turn_on(self, capture_time=None):
         pass
 
-    def turn_off(self):
+    def turn_off(self, capture_time=None):
         pass
 
+    def get_stats(self):
+        return {}
+
 class PLCReader:
-    def __init__(self, plc_info: PLCControllerConfig) -> None:
+    """Value of one coil, read by the host's shared PLCPoller."""
+
+    def __init__(self, plc_info: PLCControllerConfig, on_change=None) -> None:
         self._plc_info = plc_info
-        self._value = False
+        self._poller = get_plc_poller(plc_info)
+        self._on_change = on_change
 
     def start(self):
-        self._job = threading.Thread(target=self._run)
-        self._job.daemon = True
-        self._job.start()
+        self._poller.subscribe(self._plc_info.modbus_address, self._on_change)
 
     def get_value(self):
-        return self._value
+        return self._poller.get_value(self._plc_info.modbus_address)
 
-    def _run(self):
-        while True:
-            self._value = self._read_from_plc(self._plc_info.modbus_address)
-            time.sleep(2)
+class PLCController(PLCControllerBase):
+    """
+    turn_on/turn_off only record the wanted coil state; a writer thread
+    pushes it to the PLC over the shared persistent connection. Commands
+    that arrive while a write is pending collapse into the latest one, so
+    the frame loop never waits on the PLC. Actuation latency is measured
+    from the first command that asked for a state to the acknowledged write.
+    """
 
-    def _read_from_plc(self, modbus_address):
-        client = ModbusClient(host=self._plc_info.plc_ip_address, port=self._plc_info.plc_port)
-        try:
-            # Kết nối với PLC
-            if client.open():
-                # Ghi giá trị boolean xuống PLC
-                result = client.read_coils(modbus_address, 1)
-                print(result)
-                if result is not None and len(result) > 0:
-                    return result[0]
-                else:
-                    return False
-            else:
-                print("Không thể kết nối với PLC")
-                return False
-        except Exception as e:
-            print("Lỗi khi ghi giá trị xuống PLC:", str(e))
-            return False
-        finally:
-            # Đóng kết nối với PLC sau khi hoàn thành
-            client.close()
+    RETRY_INTERVAL = 0.5
 
-class PLCController(PLCControllerBase):
-    def __init__(self, plc_info: PLCControllerConfig):
+    def __init__(self, plc_info: PLCControllerConfig, camera_id=None):
         self._plc_info = plc_info
+        self._camera_id = camera_id
+        self._connection = get_plc_connection(plc_info)
+        self._cond = threading.Condition()
+        # last state acknowledged by the PLC and the state the handler wants, None if unknown
         self._state = None
-    
+        self._desired = None
+        self._request_time = None
+        self._capture_time = None
+        self.write_count = 0
+        self.collapsed_count = 0
+        self.failed_count = 0
+        self._latency_total = 0
+        self._latency_max = 0
+        self._t = threading.Thread(target=self._run)
+        self._t.daemon = True
+        self._t.start()
+
     def _read_from_plc(self, modbus_address):
-        client = ModbusClient(host=self._plc_info.plc_ip_address, port=self._plc_info.plc_port)
-        try:
-            # Kết nối với PLC
-            if client.open():
-                # Ghi giá trị boolean xuống PLC
-                result = client.read_coils(modbus_address, 1)
-                if result is not None and len(result) > 0:
-                    return result[0]
-                else:
-                    return False
-            else:
-                print("Không thể kết nối với PLC")
-                return False
-        except Exception as e:
-            print("Lỗi khi đọc giá trị PLC:", str(e))
-            return False
-        finally:
-            # Đóng kết nối với PLC sau khi hoàn thành
-            client.close()
+        """The coil value, None if the read failed."""
+        result = self._connection.read_coils(modbus_address, 1)
+        if result is not None and len(result) > 0:
+            return result[0]
+        return None
 
     def _write_to_plc(self, modbus_address, value_to_write):
         """
         Hàm này ghi giá trị xuống PLC thông qua Modbus TCP.
 
         Parameters:
-            plc_ip (str): Địa chỉ IP của PLC.
-            plc_port (int): Cổng Modbus TCP của PLC.
-            plc_address (int): Địa chỉ thiết bị Modbus trong PLC. Note = 1
             modbus_address (int): Địa chỉ Modbus của coil hoặc thanh ghi cần ghi giá trị.
             value_to_write (bool): Giá trị boolean cần ghi (True hoặc False).
 
         Returns:
             bool: Trả về True nếu việc ghi thành công, False nếu việc ghi thất bại.
         """
-        client = ModbusClient(host=self._plc_info.plc_ip_address, port=self._plc_info.plc_port)
-        try:
-            # Kết nối với PLC
-            if client.open():
-                # Ghi giá trị boolean xuống PLC
-                result = client.write_single_coil(modbus_address, value_to_write)
-                return result
-            else:
-                print("Không thể kết nối với PLC")
-                return False
-        except Exception as e:
-            print("Lỗi khi ghi giá trị xuống PLC:", str(e))
-            return False
-        finally:
-            # Đóng kết nối với PLC sau khi hoàn thành
-            client.close()
+        return self._connection.write_single_coil(modbus_address, value_to_write)
 
     def update_state(self):
         state = self._read_from_plc(self._plc_info.modbus_address)
         print("PLC value", state)
-        if state:
-            self._state = "on"
-        else:
-            self._state = "off"
-
-    def turn_on(self):
-        # self.update_state()
-        if self._state is None or self._state == "off":
-            print(self._plc_info.modbus_address,"ON")
-            res = self._write_to_plc(self._plc_info.modbus_address, True)
-            self._state = "on"
-            return res
+        if state is None:
+            # a failed read says nothing about the coil; keep the last known state
+            return
+        with self._cond:
+            self._state = bool(state)
+            self._cond.notify()
+
+    def _request(self, value, capture_time=None):
+        with self._cond:
+            if self._desired is not None and self._desired != self._state:
+                # merged into, or replacing, a write that has not been acknowledged yet
+                self.collapsed_count += 1
+            if self._desired == value:
+                return True
+            self._desired = value
+            self._request_time = time.time()
+            self._capture_time = capture_time
+            self._cond.notify()
         return True
 
-    def turn_off(self):
-        
-        # self.update_state()
-        if self._state is None or self._state == "on":
-            print(self._plc_info.modbus_address,"OFF")
-            res = self._write_to_plc(self._plc_info.modbus_address, False)
-            self._state = "off"
-            return res
-        return True
+    def turn_on(self, capture_time=None):
+        """capture_time: capture stamp of the frame that asked for it, for capture-to-actuation latency."""
+        return self._request(True, capture_time)
+
+    def turn_off(self, capture_time=None):
+        return self._request(False, capture_time)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._desired is None or self._desired == self._state:
+                    self._cond.wait()
+                value = self._desired
+                request_time = self._request_time
+                capture_time = self._capture_time
+
+            print(self._plc_info.modbus_address, "ON" if value else "OFF")
+            if not self._write_to_plc(self._plc_info.modbus_address, value):
+                self.failed_count += 1
+                with self._cond:
+                    # a newer command wakes the retry early
+                    self._cond.wait(max(self.RETRY_INTERVAL, self._connection.retry_delay()))
+                continue
+
+            now = time.time()
+            latency = now - request_time
+            if value:
+                frame_age.record(self._camera_id, 'actuation', capture_time, now)
+            with self._cond:
+                self._state = value
+            self.write_count += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def get_stats(self, reset=True):
+        latency_avg = self._latency_total / self.write_count if self.write_count > 0 else 0
+        stats = {
+            'writes': self.write_count,
+            'collapsed': self.collapsed_count,
+            'failed': self.failed_count,
+            'pending': self._desired is not None and self._desired != self._state,
+            'actuation_latency_avg_ms': latency_avg * 1000,
+            'actuation_latency_max_ms': self._latency_max * 1000,
+            'connects': self._connection.connect_count
+        }
+        if reset:
+            self._latency_max = 0
+        return stats
 
 if __name__ == "__main__":
     import time
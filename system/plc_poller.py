@@ -0,0 +1,98 @@
+import time
+import threading
+
+from system.modbus_connection import ModbusConnection
+
+# Modbus limit on coils per read_coils request
+MAX_COILS_PER_READ = 2000
+
+
+class PLCPoller:
+    """
+    Polls every subscribed coil of one PLC on a single connection. Each poll
+    reads the contiguous range covering all subscribed addresses in as few
+    read_coils requests as possible, and subscribers are called with
+    (address, value) whenever a coil changes.
+    """
+
+    def __init__(self, connection: ModbusConnection, interval=2.0):
+        self._connection = connection
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._values = {}
+        self._t = None
+        self.poll_count = 0
+        self.request_count = 0
+        self.failed_count = 0
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @interval.setter
+    def interval(self, interval):
+        self._interval = interval
+
+    def subscribe(self, address, callback=None):
+        with self._lock:
+            callbacks = self._subscribers.setdefault(address, [])
+            if callback is not None:
+                callbacks.append(callback)
+            if self._t is None:
+                self._t = threading.Thread(target=self._run)
+                self._t.daemon = True
+                self._t.start()
+
+    def get_value(self, address, default=False):
+        return self._values.get(address, default)
+
+    def _ranges(self, addresses):
+        start = addresses[0]
+        while start <= addresses[-1]:
+            end = min(addresses[-1], start + MAX_COILS_PER_READ - 1)
+            yield start, end - start + 1
+            start = min((address for address in addresses if address > end), default=end + 1)
+
+    def poll(self):
+        with self._lock:
+            addresses = sorted(self._subscribers)
+        if len(addresses) == 0:
+            return
+        self.poll_count += 1
+        for start, count in self._ranges(addresses):
+            self.request_count += 1
+            result = self._connection.read_coils(start, count)
+            if result is None or len(result) < count:
+                self.failed_count += 1
+                continue
+            for address in addresses:
+                if start <= address < start + count:
+                    self._publish(address, bool(result[address - start]))
+
+    def _publish(self, address, value):
+        changed = self._values.get(address) != value
+        self._values[address] = value
+        if not changed:
+            return
+        with self._lock:
+            callbacks = list(self._subscribers.get(address, []))
+        for callback in callbacks:
+            try:
+                callback(address, value)
+            except Exception as e:
+                print("Lỗi khi xử lý giá trị PLC:", address, str(e))
+
+    def stats(self):
+        return {
+            'coils': len(self._subscribers),
+            'polls': self.poll_count,
+            'requests': self.request_count,
+            'failed': self.failed_count
+        }
+
+    def _run(self):
+        while True:
+            start_time = time.time()
+            self.poll()
+            time.sleep(max(0, self._interval - (time.time() - start_time)))
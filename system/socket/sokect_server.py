@@ -2,11 +2,13 @@ import threading
 import socketio
 from system.utils import get_ipv4_address
 import eventlet
+from system.metrics import metrics_app
 
 class SocketIOServer:
     def __init__(self, logic_handlers = {}):
         self.sio = socketio.Server(cors_allowed_origins="*")
-        self.app = socketio.WSGIApp(self.sio)
+        # requests socket.io does not handle fall through to the metrics endpoint
+        self.app = socketio.WSGIApp(self.sio, wsgi_app=metrics_app)
 
         self.connected_clients = {}
         self.logic_handlers = logic_handlers
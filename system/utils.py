@@ -3,6 +3,7 @@ import numpy as np
 import cv2
 from matplotlib import path
 import socket
+from system.zone_overlay import get_zone_overlay
 
 SERVER_BE_IP = '26.30.0.242'
 TRANSPARENT_SCORE = 0.3
@@ -262,12 +263,8 @@ def plot_detection_result(box, frame, color=(0, 255, 0), label=None, conf=0, txt
 
 
 def draw_area(area_config, image, color=(60, 76, 231)):
-    overlay = image.copy()
-    area_config_numpy = np.array(area_config)
-    cv2.fillPoly(overlay, pts=[area_config_numpy], color=color)
-    overlay = cv2.polylines(overlay, [area_config_numpy.reshape((-1, 1, 2))], True, LINE_AREA_COLOR, 2)
-    image = cv2.addWeighted(overlay, TRANSPARENT_SCORE, image, 1 - TRANSPARENT_SCORE, 0)
-    return image
+    overlay = get_zone_overlay(area_config, image.shape[1::-1], TRANSPARENT_SCORE, LINE_AREA_COLOR)
+    return overlay.draw(image.copy(), color)
 
 
 def get_polygon_points():
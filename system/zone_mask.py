@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+
+
+class ZoneMask:
+    """
+    A polygon zone rasterised once at the working resolution.
+
+    Point tests read the mask and box overlap is four lookups in the
+    summed-area table, instead of a matplotlib Path test per box and frame.
+    """
+
+    def __init__(self, polygon, frame_size=(1280, 720)):
+        width, height = frame_size
+        self._points = np.array(polygon, dtype=np.int32)
+        self._mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(self._mask, [self._points], 1)
+        self._integral = cv2.integral(self._mask)
+        self._rect = cv2.boundingRect(self._points)
+
+    @property
+    def mask(self):
+        return self._mask
+
+    @property
+    def rect(self):
+        """(x, y, w, h) bounding rectangle of the polygon."""
+        return self._rect
+
+    def contains_points(self, points):
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        height, width = self._mask.shape
+        inside = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+        result = np.zeros(len(points), dtype=bool)
+        result[inside] = self._mask[points[inside, 1], points[inside, 0]] > 0
+        return result
+
+    def contains_point(self, x, y):
+        return bool(self.contains_points([(x, y)])[0])
+
+    def overlap_ratios(self, boxes):
+        """Fraction of every [x1, y1, x2, y2] box area lying inside the zone."""
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        height, width = self._mask.shape
+        x1 = np.clip(boxes[:, 0], 0, width)
+        x2 = np.clip(boxes[:, 2], 0, width)
+        y1 = np.clip(boxes[:, 1], 0, height)
+        y2 = np.clip(boxes[:, 3], 0, height)
+        inside = self._integral[y2, x2] - self._integral[y1, x2] - self._integral[y2, x1] + self._integral[y1, x1]
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        return np.where(areas > 0, inside / np.maximum(areas, 1), 0.0)
+
+    def overlap_ratio(self, bbox):
+        return float(self.overlap_ratios([bbox])[0])
+
+    def check_bbox(self, bbox, overlap_threshold=None):
+        """
+        Without a threshold a box is in the zone when its top-left or
+        bottom-right corner is, like utils.check_bbox_in_poly; with one, when
+        more than overlap_threshold of its area is.
+        """
+        x1, y1, x2, y2 = bbox
+        if overlap_threshold is None:
+            return bool(self.contains_points([(x1, y1), (x2, y2)]).any())
+        return self.overlap_ratio(bbox) > overlap_threshold
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+
+class ZoneOverlay:
+    """
+    Pre-rendered translucent zone overlay.
+
+    The filled polygon and its outline are rendered once per colour into a
+    layer the size of the zone's bounding rectangle; drawing blends that
+    layer into the frame in place, only where the polygon or outline covers
+    it. The result is the same as the full-frame copy, fillPoly, polylines
+    and addWeighted of draw_area.
+    """
+
+    def __init__(self, polygon, frame_size=(1280, 720), alpha=0.3, line_color=(94, 73, 52), line_thickness=2):
+        width, height = frame_size
+        points = np.array(polygon, dtype=np.int32)
+        x, y, w, h = cv2.boundingRect(points)
+        margin = line_thickness
+        self._x1, self._y1 = max(0, x - margin), max(0, y - margin)
+        self._x2, self._y2 = min(width, x + w + margin), min(height, y + h + margin)
+        self._points = points - np.array([self._x1, self._y1], dtype=np.int32)
+        self._alpha = alpha
+        self._line_color = line_color
+        self._line_thickness = line_thickness
+
+        mask = np.zeros((self._y2 - self._y1, self._x2 - self._x1), dtype=np.uint8)
+        self._render(mask, 255, 255)
+        self._mask = mask
+        self._layers = {}
+
+    def _render(self, layer, color, line_color):
+        cv2.fillPoly(layer, pts=[self._points], color=color)
+        cv2.polylines(layer, [self._points.reshape((-1, 1, 2))], True, line_color, self._line_thickness)
+
+    def _layer(self, color):
+        color = tuple(color)
+        if color not in self._layers:
+            layer = np.zeros((self._y2 - self._y1, self._x2 - self._x1, 3), dtype=np.uint8)
+            self._render(layer, color, self._line_color)
+            self._layers[color] = layer
+        return self._layers[color]
+
+    def draw(self, image, color):
+        """Blend the overlay into image in place and return it."""
+        roi = image[self._y1:self._y2, self._x1:self._x2]
+        blended = cv2.addWeighted(self._layer(color), self._alpha, roi, 1 - self._alpha, 0)
+        cv2.copyTo(blended, self._mask, roi)
+        return image
+
+
+_overlays = {}
+
+
+def get_zone_overlay(polygon, frame_size, alpha, line_color, line_thickness=2) -> ZoneOverlay:
+    key = (tuple(map(tuple, polygon)), tuple(frame_size), alpha, tuple(line_color), line_thickness)
+    if key not in _overlays:
+        _overlays[key] = ZoneOverlay(polygon, frame_size, alpha, line_color, line_thickness)
+    return _overlays[key]
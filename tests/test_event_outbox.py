@@ -0,0 +1,76 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from system.event_outbox import EventOutbox
+
+
+class EventHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # status answered per path, and the messages received per path
+    statuses = {}
+    received = {}
+
+    def do_POST(self):
+        message = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.received.setdefault(self.path, []).append(message)
+        self.send_response(self.statuses.get(self.path, 200))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    EventHandler.statuses = {"/rejected": 400, "/throttled": 429, "/broken": 500}
+    EventHandler.received = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EventHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_delivers_and_dead_letters(server, tmp_path):
+    outbox = EventOutbox(str(tmp_path / "outbox.db"), min_backoff=0.05, max_backoff=0.1, max_attempts=3)
+    outbox.put(server + "/event", {"i": 0})
+    outbox.put(server + "/rejected", {"i": 1})
+    outbox.put(server + "/broken", {"i": 2})
+    outbox.put(server + "/throttled", {"i": 3})
+
+    assert wait_for(lambda: outbox.dead_letters() == 3)
+    received = EventHandler.received
+    assert received["/event"] == [{"i": 0}]
+    # a 4xx is not retried; a 5xx or a 429 is, until max_attempts
+    assert received["/rejected"] == [{"i": 1}]
+    assert received["/broken"] == [{"i": 2}] * 3
+    assert received["/throttled"] == [{"i": 3}] * 3
+    stats = outbox.stats()
+    assert stats['pending'] == 0
+    assert stats['delivered'] == 1
+    assert stats['dead'] == 3
+
+
+def test_unreachable_backend_does_not_use_up_attempts(tmp_path):
+    outbox = EventOutbox(str(tmp_path / "outbox.db"), min_backoff=0.05, max_backoff=0.1, max_attempts=2)
+    # nothing listens on port 9 (discard) here, so every attempt is a connection error
+    outbox.put("http://127.0.0.1:9/event", {"i": 0})
+    assert wait_for(lambda: outbox.stats()['failed'] >= 4)
+    assert outbox.pending() == 1
+    assert outbox.dead_letters() == 0
@@ -0,0 +1,101 @@
+import io
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+import pytest
+import requests
+
+from system.frame_reader import Camera, read_mjpeg_frames
+
+BOUNDARY = "frame"
+COLORS = [(0, 0, 255), (0, 255, 0), (255, 0, 0)]
+
+
+def encode(color):
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    image[:] = color
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+FRAMES = [encode(color) for color in COLORS]
+
+
+class MJPEGHandler(BaseHTTPRequestHandler):
+    # set by the hold test; the server waits on it before finishing the first part
+    release = None
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.end_headers()
+        with_length = self.path == "/length"
+        for index, frame in enumerate(FRAMES):
+            headers = f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+            if with_length:
+                headers += f"Content-Length: {len(frame)}\r\n"
+            self.wfile.write(headers.encode() + b"\r\n" + frame)
+            self.wfile.flush()
+            if self.path == "/hold" and index == 0:
+                # the first frame is complete, but neither its line break nor the next boundary has been sent
+                self.release.wait(10)
+            self.wfile.write(b"\r\n")
+        self.wfile.write(f"--{BOUNDARY}--\r\n".encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    MJPEGHandler.release = threading.Event()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MJPEGHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    MJPEGHandler.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("path", ["/length", "/no-length"])
+def test_read_mjpeg_frames(server, path):
+    with requests.get(server + path, stream=True, timeout=5) as resp:
+        frames = list(read_mjpeg_frames(resp.raw, BOUNDARY))
+    assert frames == FRAMES
+
+
+def test_frame_without_length_is_released_at_end_of_image(server):
+    with requests.get(server + "/hold", stream=True, timeout=5) as resp:
+        frames = read_mjpeg_frames(resp.raw, BOUNDARY)
+        # returns while the server is still holding back the next boundary
+        start_time = time.time()
+        assert next(frames) == FRAMES[0]
+        assert time.time() - start_time < 2
+        MJPEGHandler.release.set()
+        assert list(frames) == FRAMES[1:]
+
+
+def test_read_mjpeg_frames_split_reads():
+    body = b"".join(f"----{BOUNDARY}\r\n\r\n".encode() + frame + b"\r\n" for frame in FRAMES)
+    stream = io.BufferedReader(io.BytesIO(body), buffer_size=7)
+    assert list(read_mjpeg_frames(stream, BOUNDARY, chunk_size=7)) == FRAMES
+
+
+def test_read_mjpeg_frames_part_without_end_of_image():
+    body = f"--{BOUNDARY}\r\n\r\nnot a jpeg\r\n--{BOUNDARY}\r\n\r\n".encode() + FRAMES[0] + b"\r\n"
+    assert list(read_mjpeg_frames(io.BufferedReader(io.BytesIO(body)), BOUNDARY)) == [b"not a jpeg", FRAMES[0]]
+
+
+@pytest.mark.parametrize("path", ["/length", "/no-length"])
+def test_camera_stream_job(server, path):
+    camera = Camera("camera-test", mode="mjpeg", stream_url=server + path)
+    camera.stream_job()
+    entries = camera.get_new_frames()
+    assert [entry.seq for entry in entries] == [1, 2, 3]
+    for entry, color in zip(entries, COLORS):
+        assert entry.frame.shape == (48, 64, 3)
+        assert np.abs(entry.frame[24, 32].astype(int) - color).max() < 10
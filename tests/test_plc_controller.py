@@ -0,0 +1,141 @@
+import time
+import socket
+import multiprocessing as mp
+
+import pytest
+from pyModbusTCP.client import ModbusClient
+from pyModbusTCP.server import DataBank, ModbusServer
+
+from system.plc_controller import PLCController, PLCControllerConfig
+
+COIL = 10
+
+
+class CountingDataBank(DataBank):
+    """Counts coil writes and makes each take a while, so commands pile up behind it."""
+
+    def __init__(self, write_delay=0.05):
+        super().__init__()
+        self.write_delay = write_delay
+        self.write_count = 0
+
+    def set_coils(self, address, bit_list, srv_info=None):
+        if srv_info is not None:
+            self.write_count += 1
+            time.sleep(self.write_delay)
+        return super().set_coils(address, bit_list, srv_info)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _serve(port, coil):
+    data_bank = DataBank()
+    data_bank.set_coils(COIL, [coil])
+    ModbusServer("127.0.0.1", port, data_bank=data_bank).start()
+
+
+class PLCProcess:
+    """
+    A ModbusServer in its own process. ModbusServer.stop() keeps serving
+    connections that are already open; killing the process drops them the
+    way a PLC restart does.
+    """
+
+    def __init__(self, port, coil=False):
+        self._process = mp.get_context('spawn').Process(target=_serve, args=(port, coil))
+        self._process.daemon = True
+        self._process.start()
+        self._client = ModbusClient(host="127.0.0.1", port=port, timeout=0.5, auto_open=True, auto_close=True)
+        assert wait_for(lambda: self.coil() is not None, timeout=10)
+
+    def coil(self):
+        result = self._client.read_coils(COIL, 1)
+        return result[0] if result else None
+
+    def kill(self):
+        self._process.kill()
+        self._process.join()
+
+
+@pytest.fixture
+def port():
+    # every test gets its own endpoint, since connections are shared per host and port
+    return free_port()
+
+
+def make_controller(port):
+    config = PLCControllerConfig(plc_ip_address="127.0.0.1", plc_port=port, plc_address=1, modbus_address=COIL,
+                                 timeout=0.5, reconnect_min_backoff=0.1, reconnect_max_backoff=0.5)
+    return PLCController(config, "camera-test")
+
+
+def test_repeated_turn_on_collapses_to_one_write(port):
+    server = ModbusServer("127.0.0.1", port, no_block=True, data_bank=CountingDataBank())
+    server.start()
+    try:
+        plc = make_controller(port)
+        for _ in range(100):
+            plc.turn_on()
+        assert wait_for(lambda: server.data_bank.get_coils(COIL) == [True])
+        assert wait_for(lambda: not plc.get_stats()['pending'])
+        assert server.data_bank.write_count == 1
+        stats = plc.get_stats()
+        assert stats['writes'] == 1
+        assert stats['collapsed'] == 99
+
+        # once acknowledged, repeating the state neither writes nor counts as collapsed
+        for _ in range(10):
+            plc.turn_on()
+        time.sleep(0.2)
+        assert server.data_bank.write_count == 1
+        assert plc.get_stats()['collapsed'] == 99
+    finally:
+        server.stop()
+
+
+def test_reconnects_after_server_restart(port):
+    server = PLCProcess(port)
+    try:
+        plc = make_controller(port)
+        plc.turn_on()
+        assert wait_for(lambda: server.coil() is True)
+        server.kill()
+
+        plc.turn_off()
+        assert wait_for(lambda: plc.get_stats()['failed'] > 0)
+        assert plc.get_stats()['pending']
+
+        server = PLCProcess(port, coil=True)
+        assert wait_for(lambda: server.coil() is False)
+        stats = plc.get_stats()
+        assert stats['writes'] == 2
+        assert stats['connects'] >= 2
+        assert not stats['pending']
+    finally:
+        server.kill()
+
+
+def test_update_state_keeps_last_state_when_read_fails(port):
+    server = PLCProcess(port)
+    plc = make_controller(port)
+    plc.turn_on()
+    assert wait_for(lambda: not plc.get_stats()['pending'])
+    server.kill()
+
+    plc.update_state()
+    # the coil was not read as off, so nothing is rewritten and the state is still the acknowledged one
+    assert plc._state is True
+    assert not plc.get_stats()['pending']